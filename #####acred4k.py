@@ -1,15 +1,46 @@
+import heapq
+import json
+import mmap
+import os
 import pygame
 import random
+import struct
 import sys
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+
+try:
+    import numpy as np    # optional: only the batch simulators need it
+except ImportError:
+    np = None
 
 # ==================== INITIALIZATION ====================
-pygame.init()
+# Importing this module starts nothing: no SDL subsystem, no window. App.start()
+# does that when the game (or a tool that needs a screen) actually runs.
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 400
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Pokémon Red (GameBoy Edition)")
-clock = pygame.time.Clock()
-FPS = 60
+CAPTION = "Pokémon Red (GameBoy Edition)"
+FPS = 60                # render cap (frames per second)
+LOGIC_HZ = 60           # fixed game logic rate, independent of the render rate
+MAX_FRAME_TICKS = 8     # logic ticks run per rendered frame before time is dropped
+TILE_SIZE = 16  # collision grid cell size (one player step)
+GB_SCREEN = (160, 144)  # GameBoy resolution, for --gameboy framebuffers
+GB_WINDOW_SCALE = 4     # window scale of the bare --gameboy preset (640x576)
+MIN_FONT_SIZE = 8       # smallest point size the default font stays legible at
+
+def layout(surface, x, y):
+    """Map a UI position designed for SCREEN_WIDTH x SCREEN_HEIGHT onto surface."""
+    return (x * surface.get_width() // SCREEN_WIDTH, y * surface.get_height() // SCREEN_HEIGHT)
+
+def font_size(surface, size):
+    """Scale a point size designed for SCREEN_WIDTH x SCREEN_HEIGHT to surface.
+
+    Uses the smaller of the two axis ratios so a line that fits the design
+    screen also fits a narrower framebuffer (the GameBoy one is 4:3.6).
+    """
+    ratio = min(surface.get_width() / SCREEN_WIDTH, surface.get_height() / SCREEN_HEIGHT)
+    return max(MIN_FONT_SIZE, round(size * ratio))
 
 # GameBoy Color Palette (4 shades of green)
 BLACK = (15, 56, 15)          # darkest green
@@ -24,44 +55,1101 @@ BROWN = (101, 67, 33)         # brown for walls
 BLUE = (48, 98, 48)           # doors use dark green
 RED = (155, 0, 0)             # for menu and player hat
 
+# ==================== TEXT CACHE ====================
+_fonts = {}   # (font name, size) -> pygame.font.Font
+
+def get_font(size, name=None):
+    """Return the shared Font for (name, size), loading it on first use."""
+    font = _fonts.get((name, size))
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _fonts[(name, size)] = pygame.font.Font(name, size)
+    return font
+
+class TextCache:
+    """LRU cache of rendered text surfaces.
+
+    Keyed by (font, size, text, color, antialias), so a line is only
+    re-rendered when its string actually changes (HP, battle message...).
+    Callers pass font_size(surface, ...), so each framebuffer size gets
+    its own entries.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, size, color, antialias=True, font=None):
+        if _render_format is not None:
+            antialias = False     # SDL cannot blend per-pixel alpha onto 8-bit surfaces
+        key = (font, size, text, color, antialias)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = get_font(size, font).render(text, antialias, color)
+        if antialias and pygame.display.get_surface() is not None:
+            surf = surf.convert_alpha()
+        self.surfaces[key] = surf
+        while len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.surfaces), "maxsize": self.maxsize}
+
+text_cache = TextCache()
+
+# ==================== SPRITE ATLAS ====================
+ATLAS_PAGE_SIZE = 512
+ATLAS_COLORKEY = (255, 0, 255)   # transparent in atlas pages; sprites must not use it
+
+class SpriteAtlas:
+    """Packs small images into a few large surfaces ("pages").
+
+    Images go onto shelves left to right, top to bottom; a full page gets a
+    successor. Drawing an image is a blit of its area of a page, so a whole
+    layer of them can go to the screen in one Surface.blits() call (see
+    SpriteBatch) instead of one primitive per object.
+
+    Pages are colorkeyed rather than per-pixel alpha (colorkey blits are
+    3-4x faster here), so transparency is all or nothing: an image's
+    fully transparent pixels stay transparent, partial alpha is flattened
+    against the key colour.
+    """
+
+    def __init__(self, page_size=(ATLAS_PAGE_SIZE, ATLAS_PAGE_SIZE)):
+        self.page_size = page_size
+        self.pages = []
+        self.regions = {}     # name -> (page index, Rect)
+        self.converted = False
+        self._x = self._y = self._shelf = 0
+
+    def add(self, name, image):
+        width, height = image.get_size()
+        page_width, page_height = self.page_size
+        if width > page_width or height > page_height:
+            raise ValueError(f"sprite {name!r} ({width}x{height}) does not fit a {page_width}x{page_height} page")
+        if self._x + width > page_width:         # next shelf
+            self._x, self._y, self._shelf = 0, self._y + self._shelf, 0
+        if not self.pages or self._y + height > page_height:  # next page
+            page = pygame.Surface(self.page_size)
+            page.fill(ATLAS_COLORKEY)
+            page.set_colorkey(ATLAS_COLORKEY)
+            self.pages.append(page)
+            self._x = self._y = self._shelf = 0
+        area = pygame.Rect(self._x, self._y, width, height)
+        self.pages[-1].blit(image, area)
+        self.regions[name] = (len(self.pages) - 1, area)
+        self._x += width
+        self._shelf = max(self._shelf, height)
+        self.converted = False
+        return area
+
+    def convert(self):
+        """Convert the pages to the display's pixel format (needs a display)."""
+        pages = []
+        for page in self.pages:
+            # Indexed mode: map the page onto the logical palette once
+            page = page.convert(_render_format) if _render_format is not None else page.convert()
+            page.set_colorkey(ATLAS_COLORKEY)
+            pages.append(page)
+        self.pages = pages
+        self.converted = True
+
+    def __contains__(self, name):
+        return name in self.regions
+
+    def __getitem__(self, name):
+        """(page surface, area) of a sprite: the source and area arguments of a blit."""
+        index, area = self.regions[name]
+        return self.pages[index], area
+
+class SpriteBatch:
+    """Per-layer draw lists, each sent to the surface in one Surface.blits() call.
+
+    Layers are drawn in the order given, so later layers end up on top.
+    """
+
+    def __init__(self, atlas, layers=("tiles", "sprites")):
+        self.atlas = atlas
+        self.layers = {layer: [] for layer in layers}
+
+    def add(self, layer, name, dest):
+        page, area = self.atlas[name]
+        self.layers[layer].append((page, dest, area))
+
+    def add_many(self, layer, name, dests):
+        page, area = self.atlas[name]
+        self.layers[layer].extend([(page, dest, area) for dest in dests])
+
+    def __len__(self):
+        return sum(len(items) for items in self.layers.values())
+
+    def draw(self, surface):
+        for items in self.layers.values():
+            if items:
+                surface.blits(items, doreturn=False)
+                items.clear()
+
+_sprites = None
+
+def get_sprites():
+    """The game's atlas (map tiles and the player), built on first use and
+    converted once a display exists."""
+    global _sprites
+    if _sprites is None:
+        _sprites = SpriteAtlas()
+        for name, color in (("wall", BLACK), ("grass", LIGHT_GREEN), ("door", WHITE)):
+            tile = pygame.Surface((TILE_SIZE, TILE_SIZE))
+            tile.fill(color)
+            _sprites.add(name, tile)
+        player = pygame.Surface((16, 16), pygame.SRCALPHA)
+        player.fill(RED, (4, 0, 8, 4))       # hat
+        player.fill(WHITE, (2, 4, 12, 12))   # body
+        _sprites.add("player", player)
+    if not _sprites.converted and (pygame.display.get_surface() is not None or _render_format is not None):
+        _sprites.convert()
+    return _sprites
+
+# ==================== PALETTE ====================
+# The 8-bit render mode (App(indexed=True)) draws every layer into surfaces
+# that share one fixed logical palette, so blits between them copy indices.
+# Slots 0-7 are the colours the game draws with, 8-15 the same colours as the
+# battle overlay dims them; the rest of the 256 repeat slot 0 so that SDL's
+# nearest-colour matching (text, sprites) never lands outside them. What the
+# indices look like on screen is decided per frame by Presenter.set_palette,
+# so palette themes, fades and flashes never redraw a layer.
+#
+# It is a look, not a speed-up. SDL2 window surfaces are always in the
+# display's own (32-bit) format: pygame 2 ignores set_mode(depth=8) and
+# display.set_palette() fails on them, so there is no 8-bit display to hand
+# the palette to. Presenter.compose() therefore converts the frame to the
+# window format every frame, which leaves it a little slower than the
+# 32-bit path (see benchmark.py's Presenter.compose cases); the default
+# 32-bit mode stays the fast one.
+BATTLE_DIM_ALPHA = 180
+PALETTE_COLORS = [BLACK, DARK_GREEN, LIGHT_GREEN, WHITE, RED, YELLOW, BROWN, ATLAS_COLORKEY]
+
+# Alternative GameBoy palettes: darkest to lightest, replacing the four greens
+GB_PALETTES = {
+    "green": (BLACK, DARK_GREEN, LIGHT_GREEN, WHITE),
+    "pocket": ((15, 15, 15), (86, 86, 86), (171, 171, 171), (230, 230, 230)),
+    "red": ((40, 16, 8), (136, 48, 32), (224, 128, 96), (248, 232, 200)),
+    "ice": ((16, 24, 48), (48, 80, 136), (136, 176, 216), (224, 240, 248)),
+}
+
+def dim_color(color, dark=BLACK, alpha=BATTLE_DIM_ALPHA):
+    """color under the battle overlay: dark blended over it at alpha."""
+    return tuple(round(c + (d - c) * alpha / 255) for c, d in zip(color, dark))
+
+def build_palette(colors=PALETTE_COLORS, dark=BLACK):
+    """The full 256-entry palette for base colours: base, dimmed base, padding."""
+    palette = list(colors) + [dim_color(c, dark) for c in colors]
+    return palette + [palette[0]] * (256 - len(palette))
+
+LOGICAL_PALETTE = build_palette()
+FADE_TIME = 0.25        # seconds a map fades in from dark after a door (indexed mode)
+FLASH_TIME = 0.45       # seconds the screen flashes for when a battle starts...
+FLASH_COUNT = 3         # ...and how many times
+FADE_LEVELS = 32        # fade steps a Presenter precomputes palettes for, per theme
+
+def palette_effect(effect, now):
+    """Presenter.set_palette() arguments for a running ("fade" | "flash", start) effect, or None once it is over."""
+    kind, start = effect
+    if kind == "fade":
+        progress = (now - start) / FADE_TIME
+        return None if progress >= 1.0 else {"fade": 1.0 - progress}
+    progress = (now - start) / FLASH_TIME
+    return None if progress >= 1.0 else {"flash": int(progress * FLASH_COUNT * 2) % 2 == 0}
+
+_render_format = None   # indexed mode: an 8-bit surface new layers copy the format of
+
+def set_render_format(surface):
+    """Make make_surface() produce layers in surface's (8-bit) format, or None for the display's."""
+    global _render_format
+    _render_format = surface
+    _dim_overlays.clear()
+    text_cache.clear()
+    if _sprites is not None:
+        _sprites.converted = False
+
+def make_surface(size):
+    """A surface for a pre-rendered layer, in the framebuffer's pixel format."""
+    if _render_format is not None:
+        surface = pygame.Surface(size, 0, _render_format)
+        surface.set_palette(LOGICAL_PALETTE)
+        return surface
+    surface = pygame.Surface(size)
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert()
+    return surface
+
+# ==================== SPATIAL INDEX ====================
+WALL = "wall"
+GRASS = "grass"
+DOOR = "door"
+
+Probe = namedtuple("Probe", "wall grass door")  # door: (target_map, spawn_x, spawn_y) or None
+BLOCKED_PROBE = Probe(True, False, None)         # Map.probe(..., stop_at_wall=True) on a wall
+
+class IndexEntry:
+    __slots__ = ("tag", "rect", "data", "order")
+
+    def __init__(self, tag, rect, data, order):
+        self.tag = tag
+        self.rect = rect
+        self.data = data
+        self.order = order    # insertion order, so lookups keep list priority
+
+class SpatialIndex:
+    """Uniform-grid buckets of tagged rects, keyed by (cell_x, cell_y)."""
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.buckets = {}
+        self.count = 0
+        self._next_order = 0
+
+    def _cells(self, rect):
+        # Lookups inline this double loop: they run every tick, this does not
+        size = self.cell_size
+        return [(cx, cy) for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1)]
+
+    def insert(self, tag, rect, data=None):
+        entry = IndexEntry(tag, rect, data, self._next_order)
+        self._next_order += 1
+        for cell in self._cells(rect):
+            self.buckets.setdefault(cell, []).append(entry)
+        self.count += 1
+        return entry
+
+    def remove(self, entry):
+        for cell in self._cells(entry.rect):
+            bucket = self.buckets.get(cell)
+            if bucket is None:
+                continue
+            bucket[:] = [e for e in bucket if e is not entry]
+            if not bucket:
+                del self.buckets[cell]
+        self.count -= 1
+
+    def find(self, tag, rect):
+        """Return the entry stored with exactly this tag and rect, or None."""
+        for cell in self._cells(rect):
+            for entry in self.buckets.get(cell, ()):
+                if entry.tag == tag and entry.rect == rect:
+                    return entry
+        return None
+
+    def query(self, rect, tag=None):
+        """All entries overlapping rect (optionally of one tag), in insertion order."""
+        found = {}
+        buckets, size = self.buckets, self.cell_size
+        cx0, cx1 = rect.left // size, (rect.right - 1) // size + 1
+        for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for cx in range(cx0, cx1):
+                for entry in buckets.get((cx, cy), ()):
+                    if (tag is None or entry.tag == tag) and entry.rect.colliderect(rect):
+                        found[entry.order] = entry
+        return [found[order] for order in sorted(found)]
+
+    def first(self, rect, tag):
+        best = None
+        buckets, size = self.buckets, self.cell_size
+        cx0, cx1 = rect.left // size, (rect.right - 1) // size + 1
+        for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for cx in range(cx0, cx1):
+                for entry in buckets.get((cx, cy), ()):
+                    if entry.tag == tag and (best is None or entry.order < best.order) \
+                            and entry.rect.colliderect(rect):
+                        best = entry
+        return best
+
+    def any(self, rect, tag):
+        buckets, size = self.buckets, self.cell_size
+        cx0, cx1 = rect.left // size, (rect.right - 1) // size + 1
+        for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for cx in range(cx0, cx1):
+                for entry in buckets.get((cx, cy), ()):
+                    if entry.tag == tag and entry.rect.colliderect(rect):
+                        return True
+        return False
+
+# ==================== ENCOUNTER TABLES ====================
+ENCOUNTER_RATE = 0.10   # chance of a battle per step onto grass
+
+class EncounterTable:
+    """Weighted wild Pokémon sampler, compiled once with Vose's alias method.
+
+    entries are species names (weight 1) or (species, weight) tuples, with an
+    optional third (min_level, max_level) item kept for later use. sample()
+    costs one rng.random() call and O(1) time however long the list is.
+    """
+
+    def __init__(self, entries):
+        self.species = []
+        self.levels = []
+        weights = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = (entry, 1)
+            self.species.append(entry[0])
+            weights.append(float(entry[1]))
+            self.levels.append(entry[2] if len(entry) > 2 else None)
+        self.size = n = len(self.species)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            return
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left is 1.0 up to rounding error
+
+    def __len__(self):
+        return self.size
+
+    def sample(self, rng):
+        u = rng.random() * self.size
+        i = int(u)
+        return self.species[i if u - i < self.prob[i] else self.alias[i]]
+
 # ==================== MAP CLASS ====================
+BACKGROUND_MAX_PIXELS = 1024 * 1024  # maps up to this area keep one pre-rendered surface
+CHUNK_SIZE = 256        # larger maps render their background in chunks of this size...
+CHUNK_CACHE_SIZE = 64   # ...and keep this many (about 16 MB) around the camera
+LINEAR_SCAN_RECTS = 64  # maps with at most this many walls + grass + doors answer queries
+                        # with C-level Rect.collidelist scans: cheaper than the bitmap and index
+
 class Map:
-    def __init__(self, name, width, height, walls, grass, wild_pokemon, exits, doors=None):
+    def __init__(self, name, width, height, walls, grass, wild_pokemon, exits, doors=None,
+                 encounter_rate=ENCOUNTER_RATE, seed=None, solid_tiles=None, grass_tiles=None):
         self.name = name
         self.width = width
         self.height = height
         self.walls = walls                # list of pygame.Rect (collidable)
         self.grass = grass                # list of pygame.Rect (wild encounters)
-        self.wild_pokemon = wild_pokemon  # list of species names
+        self.wild_pokemon = wild_pokemon  # species names or (species, weight) tuples
         self.exits = exits                 # dict: "up"/"down"/"left"/"right" -> (map_name, x, y)
         self.doors = doors if doors else [] # list of (rect, target_map, spawn_x, spawn_y)
+        self.encounters = EncounterTable(wild_pokemon)
+        self.encounter_rate = encounter_rate
+        self.reseed(seed)
+        self.revision = 0                 # bumped whenever walls/grass/doors change
+        self.edits = []                   # (method, args) of every runtime edit, see MapRegistry
+        self._background = None           # pre-rendered static layer, see draw()
+        self._background_revision = -1
+        self._navigator = None            # see navigator
+        self.chunked = width * height > BACKGROUND_MAX_PIXELS
+        self._chunks = OrderedDict()      # (cx, cy) -> Surface, for chunked maps
+        self._chunks_revision = 0
+        self._build_index(solid_tiles, grass_tiles)
 
-    def check_collision(self, rect):
+    @property
+    def navigator(self):
+        """The map's Navigator (paths and flow fields), created on first use."""
+        if self._navigator is None:
+            self._navigator = Navigator(self)
+        return self._navigator
+
+    def _build_index(self, solid_tiles=None, grass_tiles=None):
+        # Walls, grass and doors all live in one spatial index. On top of that
+        # the walls are baked into a per-tile bitmap over the 16px grid: a tile
+        # a single wall covers completely is marked solid and answers a
+        # collision check without touching the index at all.
+        # solid_tiles / grass_tiles are optional prebuilt layers (one byte per
+        # tile, e.g. memoryviews into a binary map file) used as-is, uncopied.
+        # With a wall layer, solid is that layer, left read-only: tiles that
+        # rects cover go into the sparse wall_tiles set instead.
+        self.cols = -(-self.width // TILE_SIZE)
+        self.rows = -(-self.height // TILE_SIZE)
+        for layer in (solid_tiles, grass_tiles):
+            if layer is not None and len(layer) != self.cols * self.rows:
+                raise ValueError(f"{self.name}: tile layer has {len(layer)} bytes, "
+                                 f"expected {self.cols}x{self.rows}")
+        self.base_solid = solid_tiles    # walls that exist only as tiles
+        self.grass_tiles = grass_tiles
+        self.solid = solid_tiles if solid_tiles is not None else bytearray(self.cols * self.rows)
+        self.wall_tiles = set()
+        self.index = SpatialIndex()
         for wall in self.walls:
-            if wall.colliderect(rect):
-                return True
+            self.index.insert(WALL, wall)
+            self._bake_wall(wall)
+        for g in self.grass:
+            self.index.insert(GRASS, g)
+        for door_rect, target_map, spawn_x, spawn_y in self.doors:
+            self.index.insert(DOOR, door_rect, (target_map, spawn_x, spawn_y))
+
+    def _tile_span(self, rect):
+        """Return the (col0, row0, col1, row1) tiles under rect, clipped to the grid."""
+        col0 = max(rect.left // TILE_SIZE, 0)
+        row0 = max(rect.top // TILE_SIZE, 0)
+        col1 = min((rect.right - 1) // TILE_SIZE, self.cols - 1)
+        row1 = min((rect.bottom - 1) // TILE_SIZE, self.rows - 1)
+        return col0, row0, col1, row1
+
+    def bounds_contain(self, rect):
+        """True if rect lies entirely on the tile grid."""
+        return pygame.Rect(0, 0, self.cols * TILE_SIZE, self.rows * TILE_SIZE).contains(rect)
+
+    def _tiles_hit(self, layer, rect):
+        """True if any tile under rect is set in a one-byte-per-tile layer."""
+        # Runs for every step: _tile_span is inlined
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        if right <= left or bottom <= top:
+            return False
+        cols = self.cols
+        col0 = left // TILE_SIZE if left > 0 else 0
+        col1 = min((right - 1) // TILE_SIZE, cols - 1) + 1
+        row1 = min((bottom - 1) // TILE_SIZE, self.rows - 1)
+        for base in range((top // TILE_SIZE if top > 0 else 0) * cols, row1 * cols + 1, cols):
+            for index in range(base + col0, base + col1):
+                if layer[index]:
+                    return True
         return False
 
+    def _tiles_in(self, tiles, rect):
+        """True if any tile under rect is in a set of tile indices."""
+        col0, row0, col1, row1 = self._tile_span(rect)
+        cols = self.cols
+        return any(index in tiles for row in range(row0, row1 + 1)
+                   for index in range(row * cols + col0, row * cols + col1 + 1))
+
+    def _bake_wall(self, wall):
+        overlay = self.base_solid is not None
+        col0, row0, col1, row1 = self._tile_span(wall)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = row * self.cols + col
+                tile = pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                if not self.solid[index] and wall.contains(tile):
+                    if overlay:
+                        self.wall_tiles.add(index)
+                    else:
+                        self.solid[index] = 1
+
+    def _rebake_tiles(self, rect):
+        # A wall went away: re-derive the solid bit of every tile it touched.
+        base = self.base_solid
+        col0, row0, col1, row1 = self._tile_span(rect)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = row * self.cols + col
+                tile = pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                covered = any(e.rect.contains(tile) for e in self.index.query(tile, WALL))
+                if base is None:
+                    self.solid[index] = 1 if covered else 0
+                elif covered and not base[index]:
+                    self.wall_tiles.add(index)
+                else:
+                    self.wall_tiles.discard(index)
+
+    def _layer_block(self, layer, rect):
+        """Indices of the tiles rect covers if they are all set in layer, else None."""
+        if layer is None or not rect or not _is_tile_aligned(rect) or not self.bounds_contain(rect):
+            return None
+        col0, row0, col1, row1 = self._tile_span(rect)
+        tiles = [row * self.cols + col for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+        return tiles if all(layer[index] for index in tiles) else None
+
+    def reseed(self, seed):
+        """Restart this map's encounter RNG; the stream depends on seed and map name."""
+        self.rng = random.Random(None if seed is None else f"{seed}:{self.name}")
+
+    def roll_encounter(self):
+        """Roll for one step onto grass; return the species to battle, or None."""
+        if self.rng.random() >= self.encounter_rate or not self.encounters:
+            return None
+        return self.encounters.sample(self.rng)
+
+    # ----- runtime edits -----
+    def add_wall(self, rect):
+        rect = pygame.Rect(rect)     # the map's own copy: the caller may move or reuse theirs
+        self.edits.append(("add_wall", (pygame.Rect(rect),)))
+        self.walls.append(rect)
+        self.index.insert(WALL, rect)
+        self._bake_wall(rect)
+        self.revision += 1
+
+    def remove_wall(self, rect):
+        # A wall is a rect in the index or, on a binary map, a tile-aligned
+        # block of the wall layer (which holds no rects for them)
+        entry = self.index.find(WALL, rect)
+        tiles = self._layer_block(self.base_solid, rect) if entry is None else None
+        if entry is None and tiles is None:
+            raise ValueError(f"{self.name}: no wall at {rect}")
+        self.edits.append(("remove_wall", (pygame.Rect(rect),)))
+        if entry is not None:
+            self.index.remove(entry)
+            self.walls.remove(rect)
+        else:
+            if not isinstance(self.base_solid, bytearray):   # copy-on-write: a file's layer is read-only
+                self.base_solid = self.solid = bytearray(self.base_solid)
+            for index in tiles:
+                self.base_solid[index] = 0
+        self._rebake_tiles(rect)
+        self.revision += 1
+
+    def add_grass(self, rect):
+        rect = pygame.Rect(rect)
+        self.edits.append(("add_grass", (pygame.Rect(rect),)))
+        self.grass.append(rect)
+        self.index.insert(GRASS, rect)
+        self.revision += 1
+
+    def remove_grass(self, rect):
+        # Like remove_wall: a rect in the index or a block of the grass layer
+        entry = self.index.find(GRASS, rect)
+        tiles = self._layer_block(self.grass_tiles, rect) if entry is None else None
+        if entry is None and tiles is None:
+            raise ValueError(f"{self.name}: no grass at {rect}")
+        self.edits.append(("remove_grass", (pygame.Rect(rect),)))
+        if entry is not None:
+            self.index.remove(entry)
+            self.grass.remove(rect)
+        else:
+            if not isinstance(self.grass_tiles, bytearray):
+                self.grass_tiles = bytearray(self.grass_tiles)
+            for index in tiles:
+                self.grass_tiles[index] = 0
+        self.revision += 1
+
+    def add_door(self, rect, target_map, spawn_x, spawn_y):
+        rect = pygame.Rect(rect)
+        self.edits.append(("add_door", (pygame.Rect(rect), target_map, spawn_x, spawn_y)))
+        self.doors.append((rect, target_map, spawn_x, spawn_y))
+        self.index.insert(DOOR, rect, (target_map, spawn_x, spawn_y))
+        self.revision += 1
+
+    def remove_door(self, rect):
+        entry = self.index.find(DOOR, rect)
+        if entry is None:
+            raise ValueError(f"{self.name}: no door at {rect}")
+        self.edits.append(("remove_door", (pygame.Rect(rect),)))
+        self.index.remove(entry)
+        for i, (door_rect, target_map, spawn_x, spawn_y) in enumerate(self.doors):
+            if door_rect == rect and (target_map, spawn_x, spawn_y) == entry.data:
+                del self.doors[i]
+                break
+        self.revision += 1
+
+    # ----- queries -----
+    def probe(self, rect, stop_at_wall=False):
+        """Answer collision, grass and door for rect with a single pass over the index.
+
+        With stop_at_wall a rect that hits a wall comes back as Probe(True,
+        False, None) as soon as the wall is found: all a blocked step needs.
+        """
+        if self.index.count <= LINEAR_SCAN_RECTS:
+            wall = rect.collidelist(self.walls) >= 0 or \
+                (self.base_solid is not None and self._tiles_hit(self.base_solid, rect))
+            if wall and stop_at_wall:
+                return BLOCKED_PROBE
+            grass = rect.collidelist(self.grass) >= 0 or \
+                (self.grass_tiles is not None and self._tiles_hit(self.grass_tiles, rect))
+            for door_rect, target_map, spawn_x, spawn_y in self.doors:
+                if door_rect.colliderect(rect):
+                    return Probe(wall, grass, (target_map, spawn_x, spawn_y))
+            return Probe(wall, grass, None)
+        wall = self._tiles_hit(self.solid, rect) or (len(self.wall_tiles) > 0 and self._tiles_in(self.wall_tiles, rect))
+        if wall and stop_at_wall:
+            return BLOCKED_PROBE
+        grass = self.grass_tiles is not None and self._tiles_hit(self.grass_tiles, rect)
+        door = None
+        index = self.index
+        buckets, size = index.buckets, index.cell_size
+        cx0, cx1 = rect.left // size, (rect.right - 1) // size + 1
+        for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for cx in range(cx0, cx1):
+                for entry in buckets.get((cx, cy), ()):
+                    tag = entry.tag
+                    if tag == WALL:
+                        # once the bitmap (or an earlier entry) has answered, walls cost a compare
+                        if not wall and entry.rect.colliderect(rect):
+                            if stop_at_wall:
+                                return BLOCKED_PROBE
+                            wall = True
+                    elif tag == GRASS:
+                        if not grass and entry.rect.colliderect(rect):
+                            grass = True
+                    elif (door is None or entry.order < door.order) and entry.rect.colliderect(rect):
+                        door = entry    # the first door inserted wins, as in get_door
+        return Probe(wall, grass, door and door.data)
+
+    def check_collision(self, rect):
+        # Small maps scan their walls (and any wall tiles from a binary file).
+        # Otherwise solid tiles answer straight from the bitmap; anything else
+        # (walls that only clip a tile, or rects off the grid) goes through the index.
+        if self.index.count <= LINEAR_SCAN_RECTS:
+            return rect.collidelist(self.walls) >= 0 or \
+                (self.base_solid is not None and self._tiles_hit(self.base_solid, rect))
+        return self._tiles_hit(self.solid, rect) or self.index.any(rect, WALL)
+
     def is_grass(self, rect):
-        for g in self.grass:
-            if g.colliderect(rect):
-                return True
-        return False
+        if self.grass_tiles is not None and self._tiles_hit(self.grass_tiles, rect):
+            return True
+        if self.index.count <= LINEAR_SCAN_RECTS:
+            return rect.collidelist(self.grass) >= 0
+        return self.index.any(rect, GRASS)
 
     def get_door(self, rect):
-        for door_rect, target_map, spawn_x, spawn_y in self.doors:
-            if door_rect.colliderect(rect):
-                return target_map, spawn_x, spawn_y
-        return None
+        if self.index.count <= LINEAR_SCAN_RECTS:
+            for door_rect, target_map, spawn_x, spawn_y in self.doors:
+                if door_rect.colliderect(rect):
+                    return target_map, spawn_x, spawn_y
+            return None
+        entry = self.index.first(rect, DOOR)
+        return entry.data if entry else None
 
-    def draw(self, surface):
-        surface.fill(DARK_GREEN)          # background
+    def render_background(self):
+        """Pre-render the static geometry (ground, walls, grass, doors) once."""
+        background = make_surface((self.width, self.height))
+        background.fill(DARK_GREEN)
+        self._blit_tiles(background, self.base_solid, "wall")
         for wall in self.walls:
-            pygame.draw.rect(surface, BLACK, wall)
+            pygame.draw.rect(background, BLACK, wall)
+        self._blit_tiles(background, self.grass_tiles, "grass")
         for g in self.grass:
-            pygame.draw.rect(surface, LIGHT_GREEN, g)
+            pygame.draw.rect(background, LIGHT_GREEN, g)
         for door_rect, _, _, _ in self.doors:
-            pygame.draw.rect(surface, WHITE, door_rect)  # doors stand out
+            pygame.draw.rect(background, WHITE, door_rect)  # doors stand out
+        return background
+
+    def render_chunk(self, cx, cy):
+        """Render one CHUNK_SIZE square of the background, from the index alone."""
+        area = pygame.Rect(cx * CHUNK_SIZE, cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE).clip(
+            0, 0, self.width, self.height)
+        chunk = make_surface(area.size)
+        chunk.fill(DARK_GREEN)
+        # Same layering as render_background(): walls, then grass, then doors
+        entries = self.index.query(area)
+        self._blit_tiles(chunk, self.base_solid, "wall", area)
+        for entry in entries:
+            if entry.tag == WALL:
+                pygame.draw.rect(chunk, BLACK, entry.rect.move(-area.x, -area.y))
+        self._blit_tiles(chunk, self.grass_tiles, "grass", area)
+        for entry in entries:
+            if entry.tag == GRASS:
+                pygame.draw.rect(chunk, LIGHT_GREEN, entry.rect.move(-area.x, -area.y))
+        for entry in entries:
+            if entry.tag == DOOR:
+                pygame.draw.rect(chunk, WHITE, entry.rect.move(-area.x, -area.y))
+        return chunk
+
+    def _chunk(self, cx, cy):
+        chunk = self._chunks.get((cx, cy))
+        if chunk is not None:
+            self._chunks.move_to_end((cx, cy))
+            return chunk
+        chunk = self._chunks[(cx, cy)] = self.render_chunk(cx, cy)
+        while len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def _blit_tiles(self, surface, layer, sprite, area=None):
+        # One atlas tile per set byte of a tile layer, all in a single blits()
+        # call; area is the part of the map surface covers (default: all of it)
+        if layer is None:
+            return
+        if area is None:
+            area = pygame.Rect(0, 0, self.width, self.height)
+        page, tile = get_sprites()[sprite]
+        items = []
+        col0, row0, col1, row1 = self._tile_span(area)
+        for row in range(row0, row1 + 1):
+            base = row * self.cols
+            y = row * TILE_SIZE - area.y
+            data = bytes(layer[base + col0:base + col1 + 1])
+            index = data.find(1)
+            while index != -1:
+                items.append((page, ((col0 + index) * TILE_SIZE - area.x, y), tile))
+                index = data.find(1, index + 1)
+        if items:
+            surface.blits(items, doreturn=False)
+
+    def prerender(self):
+        """Render the cached background if it is missing or stale; True if it was.
+
+        Chunked maps only drop stale chunks here: their chunks are rendered
+        as the camera first shows them.
+        """
+        if self.chunked:
+            if self._chunks_revision != self.revision:
+                self._chunks.clear()
+                self._chunks_revision = self.revision
+            return False
+        if self._background_revision == self.revision:
+            return False
+        self._background = self.render_background()
+        self._background_revision = self.revision
+        return True
+
+    def draw(self, surface, offset=(0, 0), clear=True):
+        # Nothing on the map moves, so a frame is blits of cached layers that
+        # are only re-rendered after add_/remove_* bumped the revision.
+        # offset is where the map's top-left lands on surface (minus the
+        # camera position, plus any scroll); only what is visible is drawn.
+        # clear fills whatever part of surface the map does not cover.
+        ox, oy = offset
+        if clear and not pygame.Rect(ox, oy, self.width, self.height).contains(surface.get_rect()):
+            surface.fill(DARK_GREEN)
+        self.prerender()
+        if not self.chunked:
+            surface.blit(self._background, offset)
+            return
+        view = surface.get_rect().move(-ox, -oy).clip(0, 0, self.width, self.height)
+        if not view:
+            return
+        for cy in range(view.top // CHUNK_SIZE, (view.bottom - 1) // CHUNK_SIZE + 1):
+            for cx in range(view.left // CHUNK_SIZE, (view.right - 1) // CHUNK_SIZE + 1):
+                surface.blit(self._chunk(cx, cy), (cx * CHUNK_SIZE + ox, cy * CHUNK_SIZE + oy))
+
+# ==================== PATHFINDING ====================
+# The player steps 16px at a time from wherever it spawned, so the positions
+# it can stand on form a 16px lattice offset by (x % 16, y % 16), not the
+# tile grid itself. A NavGrid is that lattice for one offset, with every
+# position's walkability (Map.check_collision) and grass flag computed once;
+# _lattice_table() computes them for the whole lattice with array operations
+# on the map's rects and tile layers (BatchWorld uses the same tables).
+# Paths are in lattice steps and use the same 4 moves as Player.update.
+FIELD_CACHE_SIZE = 32     # flow fields kept per map
+STEPS = ((-1, 0, pygame.K_LEFT), (1, 0, pygame.K_RIGHT),
+         (0, -1, pygame.K_UP), (0, 1, pygame.K_DOWN))   # Player.update's key order
+ON_GRASS, ON_DOOR, ON_EDGE = 1, 2, 4  # lattice position flag bits...
+BLOCKED = 0x80          # ...with walls on the high bit: "flags < BLOCKED" is one comparison
+
+def _lattice_span(x, y, w, h, x0, y0):
+    """Lattice columns [i0, i1) and rows [j0, j1) whose 16x16 box at
+    (x0 + 16 i, y0 + 16 j) overlaps the rect x, y, w, h (ints or arrays)."""
+    # a box at bx overlaps [x, x + w) iff x - 16 < bx < x + w
+    return (-((x0 + TILE_SIZE - 1 - x) // TILE_SIZE), (x + w - 1 - x0) // TILE_SIZE + 1,
+            -((y0 + TILE_SIZE - 1 - y) // TILE_SIZE), (y + h - 1 - y0) // TILE_SIZE + 1)
+
+def _lattice_hits(rects, x0, y0, shape):
+    """Whether the box at each lattice position overlaps any of rects (all non-empty)."""
+    counts = np.zeros((shape[0] + 1, shape[1] + 1), np.int32)
+    if rects:
+        x, y, w, h = np.array([tuple(r) for r in rects], np.int64).T
+        i0, i1, j0, j1 = _lattice_span(x, y, w, h, x0, y0)
+        # a difference array: +1 / -1 on the corners, then summed over both axes
+        for rows, cols, step in ((j0, i0, 1), (j0, i1, -1), (j1, i0, -1), (j1, i1, 1)):
+            np.add.at(counts, (rows, cols), step)
+    return counts.cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32)[:-1, :-1] > 0
+
+def _lattice_tiles(layer, game_map, i0, j0, ox, oy, shape):
+    """Whether the box at each lattice position covers a set tile of a
+    one-byte-per-tile layer; lattice column i starts in tile column i0 + i."""
+    h, w = shape
+    grid = np.zeros((h + 1, w + 1), bool)
+    if layer is not None:
+        rows, cols = game_map.rows, game_map.cols
+        grid[-j0:rows - j0, -i0:cols - i0] = np.frombuffer(layer, np.uint8).reshape(rows, cols) != 0
+    # off the tile grid (ox / oy > 0) a box straddles two tile columns / rows
+    hits = grid[:, :w] | grid[:, 1:] if ox else grid[:, :w]
+    return hits[:h] | hits[1:] if oy else hits[:h]
+
+def _lattice_table(game_map, ox, oy):
+    """Return (x0, y0, flags, door_cells, door_ids) for the player positions
+    (x0 + 16 i, y0 + 16 j) that can touch the map, x0 % 16 == ox, y0 % 16 == oy.
+
+    flags[j, i] holds BLOCKED / ON_GRASS / ON_DOOR for the player there, and
+    ON_EDGE where Game.check_transitions would look for an edge exit.
+    door_cells are the flat indices of the ON_DOOR positions, ascending, and
+    door_ids the index into game_map.doors of the door Map.probe() reports at
+    each. The outermost row and column on every side touch nothing and are
+    edges, so positions off the table can be clamped onto them.
+    """
+    doors = [door[0] for door in game_map.doors]
+    walls = [r for r in game_map.walls if r.width > 0 and r.height > 0]
+    grass = [r for r in game_map.grass if r.width > 0 and r.height > 0]
+    rects = walls + grass + [r for r in doors if r.width > 0 and r.height > 0]
+    left = min([0] + [r.left for r in rects])
+    top = min([0] + [r.top for r in rects])
+    right = max([game_map.cols * TILE_SIZE] + [r.right for r in rects])
+    bottom = max([game_map.rows * TILE_SIZE] + [r.bottom for r in rects])
+    # from the last box wholly above / left of everything to the first wholly below / right of it
+    i0 = (left - TILE_SIZE - ox) // TILE_SIZE
+    j0 = (top - TILE_SIZE - oy) // TILE_SIZE
+    shape = (-(-(bottom - oy) // TILE_SIZE) - j0 + 1, -(-(right - ox) // TILE_SIZE) - i0 + 1)
+    x0, y0 = ox + i0 * TILE_SIZE, oy + j0 * TILE_SIZE
+
+    blocked = _lattice_hits(walls, x0, y0, shape) | _lattice_tiles(game_map.solid, game_map, i0, j0, ox, oy, shape)
+    flags = blocked.astype(np.uint8) * BLOCKED
+    flags |= (_lattice_hits(grass, x0, y0, shape) |
+              _lattice_tiles(game_map.grass_tiles, game_map, i0, j0, ox, oy, shape)).astype(np.uint8) * ON_GRASS
+    door_at = np.full(shape, -1, np.int32)
+    # Earlier doors win, as in the index's insertion order: paint them last
+    for k in reversed(range(len(doors))):
+        r = doors[k]
+        if r.width > 0 and r.height > 0:
+            c0, c1, r0, r1 = _lattice_span(r.x, r.y, r.w, r.h, x0, y0)
+            door_at[r0:r1, c0:c1] = k
+    door_cells = np.flatnonzero(door_at >= 0)
+    door_ids = door_at.ravel()[door_cells]
+    flags.ravel()[door_cells] |= ON_DOOR
+    xs = x0 + TILE_SIZE * np.arange(shape[1])
+    ys = y0 + TILE_SIZE * np.arange(shape[0])
+    edge = ((ys <= 0) | (ys >= game_map.height - TILE_SIZE))[:, None] | \
+        ((xs <= 0) | (xs >= game_map.width - TILE_SIZE))[None, :]
+    flags |= edge.astype(np.uint8) * ON_EDGE
+    return x0, y0, flags, door_cells, door_ids
+
+
+class NavGrid:
+    """Walkable 16px lattice of one map for one lattice offset."""
+
+    def __init__(self, game_map, offset, avoid_grass=False):
+        ox, oy = offset
+        # Include the row/column hanging over the top/left edge so the
+        # positions that trigger an edge exit are part of the grid.
+        self.x0 = ox - TILE_SIZE if ox else 0
+        self.y0 = oy - TILE_SIZE if oy else 0
+        self.cols = -(-(game_map.width - self.x0) // TILE_SIZE)
+        self.rows = -(-(game_map.height - self.y0) // TILE_SIZE)
+        self.revision = game_map.revision
+        self.avoid_grass = avoid_grass
+        if np is not None:
+            x0, y0, flags = _lattice_table(game_map, ox, oy)[:3]
+            i, j = (self.x0 - x0) // TILE_SIZE, (self.y0 - y0) // TILE_SIZE
+            flags = flags[j:j + self.rows, i:i + self.cols]
+            grass = (flags & ON_GRASS) != 0
+            walkable = flags < BLOCKED
+            if avoid_grass:
+                walkable &= ~grass
+            self.walkable = bytearray(walkable.astype(np.uint8).tobytes())
+            self.grass = bytearray(grass.astype(np.uint8).tobytes())
+            return
+        walkable = bytearray(self.cols * self.rows)
+        grass = bytearray(self.cols * self.rows)
+        rect = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+        for row in range(self.rows):
+            for col in range(self.cols):
+                rect.topleft = (self.x0 + col * TILE_SIZE, self.y0 + row * TILE_SIZE)
+                i = row * self.cols + col
+                grass[i] = game_map.is_grass(rect)
+                walkable[i] = not game_map.check_collision(rect) and not (avoid_grass and grass[i])
+        self.walkable = walkable
+        self.grass = grass
+
+    def node(self, pos):
+        """Lattice index of a top-left position, or None if it is off this lattice."""
+        dx, dy = pos[0] - self.x0, pos[1] - self.y0
+        if dx % TILE_SIZE or dy % TILE_SIZE:
+            return None
+        col, row = dx // TILE_SIZE, dy // TILE_SIZE
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            return None
+        return row * self.cols + col
+
+    def pos(self, node):
+        row, col = divmod(node, self.cols)
+        return (self.x0 + col * TILE_SIZE, self.y0 + row * TILE_SIZE)
+
+    def neighbours(self, node):
+        row, col = divmod(node, self.cols)
+        walkable = self.walkable
+        for dx, dy, key in STEPS:
+            c, r = col + dx, row + dy
+            if 0 <= c < self.cols and 0 <= r < self.rows:
+                n = r * self.cols + c
+                if walkable[n]:
+                    yield n, key
+
+    def nodes_touching(self, rect):
+        """Walkable nodes whose 16x16 rect overlaps rect."""
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+        col0, col1, row0, row1 = _lattice_span(rect.x, rect.y, rect.width, rect.height, self.x0, self.y0)
+        cols = range(max(col0, 0), min(col1, self.cols))
+        walkable = self.walkable
+        return [n for row in range(max(row0, 0), min(row1, self.rows))
+                for n in range(row * self.cols + cols.start, row * self.cols + cols.stop) if walkable[n]]
+
+class FlowField:
+    """BFS distances (in steps) from every lattice position to the nearest goal.
+
+    One field serves any number of walkers on the same map and lattice:
+    each just follows direction() downhill.
+    """
+
+    def __init__(self, grid, goals):
+        self.grid = grid
+        self.revision = grid.revision
+        dist = [-1] * (grid.cols * grid.rows)
+        queue = deque()
+        for goal in goals:
+            if dist[goal] < 0:
+                dist[goal] = 0
+                queue.append(goal)
+        while queue:
+            node = queue.popleft()
+            d = dist[node] + 1
+            for n, _ in grid.neighbours(node):
+                if dist[n] < 0:
+                    dist[n] = d
+                    queue.append(n)
+        self.dist = dist
+
+    def distance(self, pos):
+        """Steps from pos to the nearest goal, or None if unreachable or off the lattice."""
+        node = self.grid.node(pos)
+        if node is None or self.dist[node] < 0:
+            return None
+        return self.dist[node]
+
+    def direction(self, pos):
+        """Key to hold at pos to get one step closer, or None (at a goal / unreachable)."""
+        node = self.grid.node(pos)
+        if node is None or self.dist[node] <= 0:
+            return None
+        want = self.dist[node] - 1
+        for n, key in self.grid.neighbours(node):
+            if self.dist[n] == want:
+                return key
+        return None
+
+    def path(self, pos):
+        """Positions from pos down to the nearest goal (both ends included), or None."""
+        node = self.grid.node(pos)
+        if node is None or self.dist[node] < 0:
+            return None
+        path = [pos]
+        dist = self.dist
+        while dist[node] > 0:
+            node = next(n for n, _ in self.grid.neighbours(node) if dist[n] == dist[node] - 1)
+            path.append(self.grid.pos(node))
+        return path
+
+class Navigator:
+    """Paths for a 16x16 walker on one map: A* for one-off queries and cached
+    BFS flow fields towards doors and exits for walkers that share a goal.
+
+    Grids and fields remember the Map.revision they were built at and are
+    rebuilt after add_/remove_wall (or any other edit) changed the map.
+    """
+
+    def __init__(self, game_map, cache_size=FIELD_CACHE_SIZE):
+        self.map = game_map
+        self.cache_size = cache_size
+        self.grids = {}               # (offset, avoid_grass) -> NavGrid
+        self.fields = OrderedDict()   # (offset, avoid_grass, goal key) -> FlowField
+        self.revision = game_map.revision
+
+    def _check_revision(self):
+        if self.revision != self.map.revision:
+            self.grids.clear()
+            self.fields.clear()
+            self.revision = self.map.revision
+
+    def grid(self, pos, avoid_grass=False):
+        """The NavGrid of the lattice pos lies on."""
+        self._check_revision()
+        key = ((pos[0] % TILE_SIZE, pos[1] % TILE_SIZE), avoid_grass)
+        grid = self.grids.get(key)
+        if grid is None:
+            grid = self.grids[key] = NavGrid(self.map, key[0], avoid_grass)
+        return grid
+
+    def find_path(self, start, goal, avoid_grass=False):
+        """A* from start to goal (top-left positions on the same lattice).
+
+        Returns the positions walked, both ends included, or None if goal
+        cannot be reached.
+        """
+        grid = self.grid(start, avoid_grass)
+        src, dst = grid.node(start), grid.node(goal)
+        if src is None or dst is None:
+            raise ValueError(f"{self.map.name}: {start} and {goal} are not on one 16px lattice of the map")
+        if not grid.walkable[dst]:
+            return None
+        goal_col, goal_row = dst % grid.cols, dst // grid.cols
+        came_from = {src: None}
+        cost = {src: 0}
+        heap = [(0, 0, src)]
+        counter = 0                   # FIFO among equal priorities
+        while heap:
+            _, _, node = heapq.heappop(heap)
+            if node == dst:
+                path = []
+                while node is not None:
+                    path.append(grid.pos(node))
+                    node = came_from[node]
+                path.reverse()
+                return path
+            step_cost = cost[node] + 1
+            for n, _ in grid.neighbours(node):
+                if step_cost < cost.get(n, step_cost + 1):
+                    cost[n] = step_cost
+                    came_from[n] = node
+                    counter += 1
+                    h = abs(n % grid.cols - goal_col) + abs(n // grid.cols - goal_row)
+                    heapq.heappush(heap, (step_cost + h, counter, n))
+        return None
+
+    def field(self, pos, goal_key, goals, avoid_grass=False):
+        """Cached flow field on pos's lattice; goals(grid) lists the goal nodes."""
+        grid = self.grid(pos, avoid_grass)
+        key = ((pos[0] % TILE_SIZE, pos[1] % TILE_SIZE), avoid_grass, goal_key)
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+        field = self.fields[key] = FlowField(grid, goals(grid))
+        while len(self.fields) > self.cache_size:
+            self.fields.popitem(last=False)
+        return field
+
+    def field_to(self, pos, goal, avoid_grass=False):
+        """Flow field towards one lattice position."""
+        def goals(grid):
+            node = grid.node(goal)
+            return [node] if node is not None and grid.walkable[node] else []
+        return self.field(pos, ("pos", tuple(goal)), goals, avoid_grass)
+
+    def field_to_door(self, pos, door, avoid_grass=False):
+        """Flow field towards a door: its index in Map.doors or its target map's name."""
+        if isinstance(door, str):
+            rects = [d[0] for d in self.map.doors if d[1] == door]
+        else:
+            rects = [self.map.doors[door][0]]
+        if not rects:
+            raise KeyError(f"{self.map.name}: no door to {door}")
+        def goals(grid):
+            return [node for rect in rects for node in grid.nodes_touching(rect)]
+        return self.field(pos, ("door", door), goals, avoid_grass)
+
+    def field_to_exit(self, pos, side, avoid_grass=False):
+        """Flow field towards the positions that trigger the exit on side (see Game.check_transitions)."""
+        if side not in self.map.exits:
+            raise KeyError(f"{self.map.name}: no exit {side!r}")
+        test = {
+            "up": lambda x, y: y <= 0,
+            "down": lambda x, y: y + TILE_SIZE >= self.map.height,
+            "left": lambda x, y: x <= 0,
+            "right": lambda x, y: x + TILE_SIZE >= self.map.width,
+        }[side]
+        def goals(grid):
+            return [n for n in range(grid.cols * grid.rows) if grid.walkable[n] and test(*grid.pos(n))]
+        return self.field(pos, ("exit", side), goals, avoid_grass)
 
 # ==================== PLAYER CLASS ====================
 class Player:
@@ -71,17 +1159,26 @@ class Player:
         self.speed = 16
         self.rect = pygame.Rect(x, y, 16, 16)
         self.in_battle = False
+        self.prev_pos = (x, y)  # position at the start of the current logic tick
+        self.draw_rect = self.rect.copy()  # where draw() last put the sprite
+        self.moved = False    # did the last update() take a step?
+        self.probe = None     # Map.probe() of the tile we last stepped onto
 
     def move(self, dx, dy, game_map):
+        # One probe of the new position answers the wall check here and the
+        # grass and door checks of update() and Game.check_transitions()
         new_rect = self.rect.move(dx, dy)
-        if not game_map.check_collision(new_rect):
-            self.rect = new_rect
-            self.x += dx
-            self.y += dy
-            return True
-        return False
+        probe = game_map.probe(new_rect, stop_at_wall=True)
+        if probe.wall:
+            return False
+        self.rect = new_rect
+        self.x += dx
+        self.y += dy
+        self.probe = probe
+        return True
 
     def update(self, keys, game_map):
+        self.moved = False
         if self.in_battle:
             return None
         moved = False
@@ -94,33 +1191,91 @@ class Player:
         elif keys[pygame.K_DOWN]:
             moved = self.move(0, self.speed, game_map)
 
-        if moved and game_map.is_grass(self.rect):
-            if random.randint(1, 100) <= 10:
+        if not moved:
+            return None
+        self.moved = True
+        if self.probe.grass:
+            species = game_map.roll_encounter()
+            if species is not None:
                 self.in_battle = True
-                return Battle(self, random.choice(game_map.wild_pokemon))
+                return Battle(self, species)
         return None
 
-    def draw(self, surface):
-        # Draw a simple player sprite (red hat + body)
-        pygame.draw.rect(surface, RED, (self.rect.x+4, self.rect.y, 8, 4))   # hat
-        pygame.draw.rect(surface, WHITE, (self.rect.x+2, self.rect.y+4, 12, 12)) # body
+    def position(self, alpha=1.0):
+        """Map position to draw at: alpha blends the previous and current logic positions."""
+        prev_x, prev_y = self.prev_pos
+        return (round(prev_x + (self.rect.x - prev_x) * alpha),
+                round(prev_y + (self.rect.y - prev_y) * alpha))
+
+    def draw(self, surface, alpha=1.0, offset=(0, 0), batch=None):
+        # batch: a SpriteBatch to queue the sprite on instead of blitting it now
+        x, y = self.position(alpha)
+        x += offset[0]
+        y += offset[1]
+        self.draw_rect = pygame.Rect(x, y, 16, 16)
+        if batch is not None:
+            batch.add("sprites", "player", (x, y))
+        else:
+            page, area = get_sprites()["player"]  # red hat + body
+            surface.blit(page, (x, y), area)
 
     def set_position(self, x, y):
         """Safely set player position and update both rect and coordinates."""
         self.x = x
         self.y = y
         self.rect.topleft = (x, y)
+        self.prev_pos = (x, y)  # teleports are not interpolated
+
+# ==================== CAMERA ====================
+class Camera:
+    """The part of the map on screen, centred on the player where the map allows.
+
+    The view is clamped to the map, so a map no bigger than the screen never
+    scrolls; offset is what Map.draw and Player.draw add to map coordinates.
+    """
+
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.width, self.height = size
+        self.x = 0
+        self.y = 0
+
+    def follow(self, pos, game_map, size=16):
+        x, y = pos
+        self.x = min(max(x + size // 2 - self.width // 2, 0), max(game_map.width - self.width, 0))
+        self.y = min(max(y + size // 2 - self.height // 2, 0), max(game_map.height - self.height, 0))
+        return self.offset
+
+    @property
+    def offset(self):
+        return (-self.x, -self.y)
+
+    @property
+    def view(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
 
 # ==================== BATTLE CLASS ====================
+PLAYER_STATS = {"name": "Charmander", "hp": 20, "attack": 10}
+WILD_STATS = {"hp": 15, "attack": 8}
+
+def attack_damage(attack):
+    """Damage dealt by an attack stat; also works element-wise on NumPy arrays."""
+    return attack - 2  # simplified
+
 class Battle:
-    def __init__(self, player, wild_pokemon):
+    def __init__(self, player, wild_pokemon, player_stats=PLAYER_STATS, wild_stats=WILD_STATS):
         self.player = player
-        self.player_pokemon = {"name": "Charmander", "hp": 20, "max_hp": 20, "attack": 10}
-        self.wild_pokemon = {"name": wild_pokemon, "hp": 15, "max_hp": 15, "attack": 8}
+        self.player_pokemon = {"name": player_stats.get("name", "Charmander"), "hp": player_stats["hp"],
+                               "max_hp": player_stats["hp"], "attack": player_stats["attack"]}
+        self.wild_pokemon = {"name": wild_pokemon, "hp": wild_stats["hp"],
+                             "max_hp": wild_stats["hp"], "attack": wild_stats["attack"]}
         self.turn = "player"
+        self.turns = 0         # attacks made so far, by either side
         self.message = f"A wild {wild_pokemon} appeared!"
         self.battle_over = False
         self.player_won = False
+        self.backdrop = None   # dimmed snapshot of the overworld, see capture_backdrop()
+        self.text_rects = []   # screen areas the text lines covered on the last draw
+        self.text_key = None   # the strings drawn there, to spot when they change
 
     def handle_input(self, keys):
         if self.battle_over or self.turn != "player":
@@ -129,9 +1284,10 @@ class Battle:
             self.player_attack()
 
     def player_attack(self):
-        damage = self.player_pokemon["attack"] - 2
+        damage = attack_damage(self.player_pokemon["attack"])
         self.wild_pokemon["hp"] -= damage
-        self.message = f"Charmander dealt {damage} damage!"
+        self.turns += 1
+        self.message = f"{self.player_pokemon['name']} dealt {damage} damage!"
         if self.wild_pokemon["hp"] <= 0:
             self.wild_pokemon["hp"] = 0
             self.message = f"Wild {self.wild_pokemon['name']} fainted!"
@@ -141,12 +1297,13 @@ class Battle:
         self.turn = "enemy"
 
     def enemy_attack(self):
-        damage = self.wild_pokemon["attack"] - 2
+        damage = attack_damage(self.wild_pokemon["attack"])
         self.player_pokemon["hp"] -= damage
+        self.turns += 1
         self.message = f"{self.wild_pokemon['name']} dealt {damage} damage!"
         if self.player_pokemon["hp"] <= 0:
             self.player_pokemon["hp"] = 0
-            self.message = "Your Charmander fainted!"
+            self.message = f"Your {self.player_pokemon['name']} fainted!"
             self.battle_over = True
             self.player_won = False
             return
@@ -158,55 +1315,406 @@ class Battle:
         if self.turn == "enemy":
             self.enemy_attack()
 
+    def capture_backdrop(self, surface):
+        """Snapshot the overworld already drawn on surface and dim it, once.
+
+        Nothing under the overlay moves during a battle, so every later frame
+        is one blit of this copy instead of map + player + alpha overlay.
+        """
+        if surface.get_bitsize() == 8:
+            # Indexed: give the copy the dimmed palette and blit it back onto
+            # the logical one, which moves every pixel to its dimmed slot
+            dimmed = surface.copy()
+            dimmed.set_palette(build_palette([dim_color(c) for c in PALETTE_COLORS]))
+            self.backdrop = make_surface(surface.get_size())
+            self.backdrop.blit(dimmed, (0, 0))
+            return
+        self.backdrop = surface.copy()
+        self.backdrop.blit(get_dim_overlay(surface.get_size()), (0, 0))
+
     def draw(self, surface):
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(180)
-        overlay.fill(BLACK)
-        surface.blit(overlay, (0, 0))
-        font = pygame.font.Font(None, 24)
+        if self.backdrop is not None and self.backdrop.get_size() == surface.get_size():
+            surface.blit(self.backdrop, (0, 0))
+        else:
+            surface.blit(get_dim_overlay(surface.get_size()), (0, 0))
+        rects = []
+        size = font_size(surface, 24)
         player_text = f"{self.player_pokemon['name']} HP: {self.player_pokemon['hp']}/{self.player_pokemon['max_hp']}"
-        player_surf = font.render(player_text, True, WHITE)
-        surface.blit(player_surf, (50, 250))
+        player_surf = text_cache.render(player_text, size, WHITE)
+        rects.append(surface.blit(player_surf, layout(surface, 50, 250)))
         enemy_text = f"Wild {self.wild_pokemon['name']} HP: {self.wild_pokemon['hp']}/{self.wild_pokemon['max_hp']}"
-        enemy_surf = font.render(enemy_text, True, WHITE)
-        surface.blit(enemy_surf, (350, 50))
-        msg_surf = font.render(self.message, True, WHITE)
-        surface.blit(msg_surf, (50, 300))
-        inst_surf = font.render("Press A to attack", True, WHITE)
-        surface.blit(inst_surf, (50, 350))
+        enemy_surf = text_cache.render(enemy_text, size, WHITE)
+        rects.append(surface.blit(enemy_surf, layout(surface, 350, 50)))
+        msg_surf = text_cache.render(self.message, size, WHITE)
+        rects.append(surface.blit(msg_surf, layout(surface, 50, 300)))
+        inst_surf = text_cache.render("Press A to attack", size, WHITE)
+        rects.append(surface.blit(inst_surf, layout(surface, 50, 350)))
         if self.battle_over:
-            over_surf = font.render("Battle over! Press SPACE to continue.", True, WHITE)
-            surface.blit(over_surf, (150, 200))
+            over_surf = text_cache.render("Battle over! Press SPACE to continue.", size, WHITE)
+            rects.append(surface.blit(over_surf, layout(surface, 150, 200)))
+        self.text_rects = rects
+        self.text_key = (player_text, enemy_text, self.message, self.battle_over)
 
-# ==================== MAIN MENU ====================
-def main_menu():
-    menu_running = True
-    selected = 0  # 0 = Start, 1 = Quit
-    font = pygame.font.Font(None, 48)
-    small_font = pygame.font.Font(None, 36)
+_dim_overlays = {}   # screen size -> pre-built battle overlay
 
-    while menu_running:
-        screen.fill(BLACK)
-        title = font.render("POKEMON RED", True, WHITE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 100))
+def get_dim_overlay(size):
+    """Return the translucent battle overlay for a screen size, built once per size."""
+    overlay = _dim_overlays.get(size)
+    if overlay is None:
+        _dim_overlays.clear()        # the screen was resized; drop the old one
+        overlay = make_surface(size)
+        overlay.set_alpha(BATTLE_DIM_ALPHA)
+        overlay.fill(BLACK)
+        _dim_overlays[size] = overlay
+    return overlay
+
+# ==================== DIRTY RECTANGLES ====================
+class DirtyTracker:
+    """Collects the screen regions that changed this frame.
+
+    With ``enabled`` off, present() is a plain display.flip(). With it on, only
+    the collected rects are pushed with display.update(); invalidate() forces
+    one full flip (map transitions, entering or leaving a battle). Given a
+    Presenter, the rects are framebuffer rects and only those get upscaled.
+    """
+
+    def __init__(self, enabled=False, presenter=None):
+        self.enabled = enabled
+        self.presenter = presenter
+        self.rects = []
+        self.full = True
+
+    def add(self, rect):
+        if self.enabled:
+            self.rects.append(pygame.Rect(rect))
 
-        start_text = small_font.render("START GAME", True, WHITE)
-        quit_text = small_font.render("QUIT", True, WHITE)
+    def add_all(self, rects):
+        if self.enabled:
+            self.rects.extend(pygame.Rect(r) for r in rects)
 
-        # Draw selection indicator
-        if selected == 0:
-            pygame.draw.rect(screen, RED, (250, 200, 100, 40), 2)
+    def invalidate(self):
+        self.full = True
+
+    def present(self):
+        if self.presenter is not None:
+            self.presenter.present(None if not self.enabled or self.full else self.rects)
+        elif not self.enabled or self.full:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.rects = []
+        self.full = False
+
+# ==================== FRAMEBUFFER ====================
+SCANLINE_SHADE = 150    # scanline rows are multiplied by SCANLINE_SHADE / 255
+
+class Presenter:
+    """Gets the internal framebuffer onto the window.
+
+    The game draws into ``frame`` at its own resolution, so drawing costs the
+    same whatever the window size. compose() scales it up by an integer
+    factor in one transform.scale() straight into the window surface (no
+    per-frame allocation) and can darken the last row of every scaled pixel
+    row for a scanline look. At scale 1 with no scanlines, frame is the
+    window itself and nothing is copied.
+
+    Indexed mode always pays an 8-to-32-bit conversion in compose(), since
+    the window cannot be 8-bit (see PALETTE).
+    """
+
+    def __init__(self, window, frame_size, scale=1, scanlines=False, indexed=False, theme="green"):
+        if window.get_size() != (frame_size[0] * scale, frame_size[1] * scale):
+            raise ValueError(f"window {window.get_size()} is not {frame_size} x {scale}")
+        self.window = window
+        self.scale = scale
+        self.scanlines = None
+        self.palette = None      # indexed mode: the palette the window sees
+        self.palettes = {}       # (theme, flash) -> palettes by fade level
+        self.theme = theme
+        if indexed:
+            # 8-bit frame in the logical palette. compose() swaps ``palette``
+            # in for the blit that converts the frame to RGB (at frame size,
+            # before upscaling), then swaps the logical one back for drawing
+            self.frame = pygame.Surface(frame_size, 0, 8)
+            self.frame.set_palette(LOGICAL_PALETTE)
+            self.palette = LOGICAL_PALETTE
+            self.set_palette()       # the theme's
+            self.rgb = window if scale == 1 else pygame.Surface(frame_size, 0, window)
+        elif scale == 1 and not scanlines:
+            self.frame = window
+            return
         else:
-            pygame.draw.rect(screen, RED, (250, 260, 100, 40), 2)
+            self.frame = pygame.Surface(frame_size, 0, window)   # same pixel format as the window
+        if scanlines and scale > 1:
+            self.scanlines = pygame.Surface(window.get_size(), 0, window)
+            self.scanlines.fill((255, 255, 255))
+            shade = (SCANLINE_SHADE,) * 3
+            for y in range(scale - 1, window.get_height(), scale):
+                self.scanlines.fill(shade, (0, y, window.get_width(), 1))
+
+    @property
+    def indexed(self):
+        return self.palette is not None
+
+    def set_palette(self, theme=None, fade=0.0, flash=False):
+        """Indexed mode: choose how the frame's colours look, without redrawing.
+
+        theme names a GB_PALETTES entry (default: the presenter's), fade goes
+        from 0 (normal) to 1 (all darkest shade), flash inverts the shades.
+        """
+        if self.palette is None:
+            return False
+        key = (theme or self.theme, flash)
+        palettes = self.palettes.get(key)
+        if palettes is None:
+            palettes = self.palettes[key] = self._fade_palettes(*key)
+        self.palette = palettes[round(fade * FADE_LEVELS)]
+        return True
+
+    @staticmethod
+    def _fade_palettes(theme, flash):
+        # FADE_LEVELS + 1 palettes from normal to all darkest shade. Only the
+        # base and dimmed colours are dimmed; the padding repeats entry 0
+        shades = GB_PALETTES[theme]
+        if flash:
+            shades = shades[::-1]
+        colors = list(shades) + PALETTE_COLORS[len(shades):]
+        darkest = shades[0]
+        palette = build_palette(colors, darkest)[:2 * len(colors)]
+        palettes = []
+        for level in range(FADE_LEVELS + 1):
+            dimmed = [dim_color(c, darkest, 255 * level / FADE_LEVELS) for c in palette] if level else palette
+            palettes.append(dimmed + [dimmed[0]] * (256 - len(dimmed)))
+        return palettes
+
+    def compose(self, rects=None):
+        """Scale rects of the frame (all of it if None) into the window; return the window rects."""
+        if self.frame is self.window:
+            return rects
+        window, scale, scanlines, palette = self.window, self.scale, self.scanlines, self.palette
+        if rects is None:
+            if palette is not None:
+                self.frame.set_palette(palette)
+                self.rgb.blit(self.frame, (0, 0))   # the palette lookup happens here
+                self.frame.set_palette(LOGICAL_PALETTE)
+                if self.rgb is not window:
+                    pygame.transform.scale(self.rgb, window.get_size(), window)
+            else:
+                pygame.transform.scale(self.frame, window.get_size(), window)
+            if scanlines is not None:
+                window.blit(scanlines, (0, 0), special_flags=pygame.BLEND_MULT)
+            return None
+        bounds = self.frame.get_rect()
+        out = []
+        if palette is not None:
+            self.frame.set_palette(palette)
+        for rect in rects:
+            rect = rect.clip(bounds)
+            if not rect:
+                continue
+            dest = pygame.Rect(rect.x * scale, rect.y * scale, rect.width * scale, rect.height * scale)
+            if palette is not None:
+                self.rgb.blit(self.frame, rect, rect)
+                if self.rgb is not window:
+                    pygame.transform.scale(self.rgb.subsurface(rect), dest.size, window.subsurface(dest))
+            else:
+                pygame.transform.scale(self.frame.subsurface(rect), dest.size, window.subsurface(dest))
+            if scanlines is not None:
+                window.blit(scanlines, dest, dest, special_flags=pygame.BLEND_MULT)
+            out.append(dest)
+        if palette is not None:
+            self.frame.set_palette(LOGICAL_PALETTE)
+        return out
+
+    def present(self, rects=None):
+        rects = self.compose(rects)
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+# ==================== FRAME PROFILER ====================
+PROFILE_PHASES = ("wait", "events", "update", "transitions", "map draw", "battle draw", "present")
+PROFILE_FRAMES = 240      # ring buffer length per phase (4 s at 60 fps)
+PROFILE_REFRESH = 30      # frames between overlay redraws
+PROFILE_KEY = pygame.K_F3
+
+def _no_lap(phase):
+    pass
+
+class FrameProfiler:
+    """Per-phase frame times, shown as a p50/p95/p99 overlay.
+
+    lap(phase) charges the time since the previous lap to phase; end_frame()
+    pushes the frame's per-phase totals into fixed-size ring buffers. The main
+    loop calls profiler.lap through a local that is rebound to a no-op while
+    the profiler is off, so a disabled profiler costs one empty call per phase.
+    """
+
+    def __init__(self, phases=PROFILE_PHASES, frames=PROFILE_FRAMES, enabled=False):
+        self.phases = phases
+        self.samples = {phase: deque(maxlen=frames) for phase in phases}
+        self.frame = dict.fromkeys(phases, 0)
+        self.mark = time.perf_counter_ns()
+        self.frames = 0
+        self.panel = None
+        self.panel_rect = None
+        self.enabled = enabled
+
+    @property
+    def lap_fn(self):
+        return self.lap if self.enabled else _no_lap
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        for buf in self.samples.values():
+            buf.clear()
+        self.frame = dict.fromkeys(self.phases, 0)
+        self.mark = time.perf_counter_ns()
+        self.frames = 0
+        self.panel = None
+        return self.enabled
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        self.frame[phase] += now - self.mark
+        self.mark = now
+
+    def end_frame(self):
+        frame = self.frame
+        for phase, buf in self.samples.items():
+            buf.append(frame[phase])
+            frame[phase] = 0
+        self.frames += 1
 
-        screen.blit(start_text, (SCREEN_WIDTH//2 - start_text.get_width()//2, 200))
-        screen.blit(quit_text, (SCREEN_WIDTH//2 - quit_text.get_width()//2, 260))
+    def percentiles(self, phase, points=(50, 95, 99)):
+        """Nearest-rank percentiles of phase over the buffered frames, in ns."""
+        ordered = sorted(self.samples[phase])
+        if not ordered:
+            return (0,) * len(points)
+        last = len(ordered) - 1
+        return tuple(ordered[min(last, (len(ordered) * p + 99) // 100 - 1)] for p in points)
 
-        pygame.display.flip()
+    def report(self):
+        return {phase: self.percentiles(phase) for phase in self.phases}
+
+    def _build_panel(self):
+        # The default font is proportional, so each column is rendered on its own
+        font = get_font(16)
+        rows = [("phase (ms)", "p50", "p95", "p99")]
+        rows += [(phase, *(f"{ns / 1e6:.2f}" for ns in values)) for phase, values in self.report().items()]
+        name_width, col_width, line = 90, 44, font.get_linesize()
+        panel = pygame.Surface((name_width + 3 * col_width + 8, line * len(rows) + 8))
+        panel.fill(BLACK)
+        for i, row in enumerate(rows):
+            y = 4 + i * line
+            panel.blit(font.render(row[0], False, WHITE), (4, y))
+            for j, cell in enumerate(row[1:], 1):
+                text = font.render(cell, False, WHITE)
+                panel.blit(text, (4 + name_width + j * col_width - text.get_width(), y))
+        panel.set_alpha(200)
+        return panel
+
+    def draw(self, surface, pos=(4, 4)):
+        """Blit the overlay; its text is rebuilt every PROFILE_REFRESH frames."""
+        if self.panel is None or self.frames % PROFILE_REFRESH == 0:
+            self.panel = self._build_panel()
+        self.panel_rect = surface.blit(self.panel, pos)
+        return self.panel_rect
+
+# ==================== APPLICATION ====================
+class App:
+    """Owns the window and the SDL subsystems the game needs.
+
+    Only display (which brings in events and timers) and font are started;
+    mixer and joystick never are. headless=True uses SDL's dummy video
+    driver so a frame can be drawn on a machine with no display.
+
+    size is the framebuffer the game draws into (``screen``); the window is
+    that times ``scale``, filled by ``presenter`` (see Presenter).
+    """
+
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT), caption=CAPTION, headless=False,
+                 scale=1, scanlines=False, indexed=False, theme="green"):
+        self.size = size
+        self.caption = caption
+        self.headless = headless
+        self.scale = scale
+        self.scanlines = scanlines
+        self.indexed = indexed    # 8-bit palettized framebuffer, see PALETTE
+        self.theme = theme
+        self.window = None
+        self.presenter = None
+        self.screen = None
+        self.clock = None
+
+    def start(self):
+        if self.headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.display.init()
+        pygame.font.init()
+        width, height = self.size
+        self.window = pygame.display.set_mode((width * self.scale, height * self.scale))
+        self.presenter = Presenter(self.window, self.size, self.scale, self.scanlines,
+                                   self.indexed, self.theme)
+        self.screen = self.presenter.frame
+        set_render_format(self.screen if self.indexed else None)
+        pygame.display.set_caption(self.caption)
+        self.clock = pygame.time.Clock()
+        return self
+
+    def stop(self):
+        set_render_format(None)
+        _fonts.clear()        # Font objects do not survive pygame.quit()
+        pygame.quit()
+
+# ==================== MAIN MENU ====================
+MENU_CURSORS = [pygame.Rect(250, 200, 100, 40), pygame.Rect(250, 260, 100, 40)]
+
+def menu_cursor(screen, selected):
+    cursor = MENU_CURSORS[selected]
+    x, y = layout(screen, cursor.centerx, cursor.y)
+    width, height = layout(screen, cursor.width, cursor.height)
+    return pygame.Rect(x - width // 2, y, width, height)
+
+def draw_menu(screen, selected):
+    screen.fill(BLACK)
+    center = screen.get_width() // 2
+    title = text_cache.render("POKEMON RED", font_size(screen, 48), WHITE)
+    screen.blit(title, (center - title.get_width()//2, layout(screen, 0, 100)[1]))
+
+    size = font_size(screen, 36)
+    start_text = text_cache.render("START GAME", size, WHITE)
+    quit_text = text_cache.render("QUIT", size, WHITE)
+
+    # Draw selection indicator
+    pygame.draw.rect(screen, RED, menu_cursor(screen, selected), 2)
+
+    screen.blit(start_text, (center - start_text.get_width()//2, layout(screen, 0, 200)[1]))
+    screen.blit(quit_text, (center - quit_text.get_width()//2, layout(screen, 0, 260)[1]))
+
+def main_menu(app, dirty=None):
+    if dirty is None:
+        dirty = DirtyTracker(presenter=app.presenter)
+    dirty.invalidate()
+    menu_running = True
+    selected = 0  # 0 = Start, 1 = Quit
+    cursors = [menu_cursor(app.screen, i) for i in range(len(MENU_CURSORS))]
+    shown = selected
+
+    while menu_running:
+        draw_menu(app.screen, selected)
+
+        # Only the cursor ever moves on this screen
+        if selected != shown:
+            dirty.add(cursors[shown])
+            dirty.add(cursors[selected])
+            shown = selected
+        dirty.present()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
+                app.stop()
                 sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_UP:
@@ -217,418 +1725,1770 @@ def main_menu():
                     if selected == 0:
                         return  # start game
                     else:
-                        pygame.quit()
+                        app.stop()
                         sys.exit()
-        clock.tick(FPS)
-
-# ==================== DEFINE ALL MAPS ====================
-
-# ----- Interior Maps (Houses) -----
-# House 1 in Pallet Town
-house1_walls = [
-    pygame.Rect(0, 0, 600, 16),    # top border
-    pygame.Rect(0, 0, 16, 400),    # left border
-    pygame.Rect(584, 0, 16, 400),  # right border
-    pygame.Rect(0, 384, 600, 16),  # bottom border
-    pygame.Rect(200, 150, 16, 16), # table/object
-    pygame.Rect(300, 200, 32, 32), # bed/couch
-]
-house1_grass = []
-house1_wild = []
-house1_exits = {}  # no edge exits, only door
-house1_doors = [
-    (pygame.Rect(300, 350, 32, 16), "Pallet Town", 120, 120)  # door near bottom; exit to outside near house
-]
-house1 = Map("Pallet House 1", 600, 400, house1_walls, house1_grass, house1_wild, house1_exits, house1_doors)
-
-# House 2 in Pallet Town
-house2_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(150, 100, 64, 64),  # big table
-    pygame.Rect(400, 250, 16, 16),
-]
-house2_grass = []
-house2_wild = []
-house2_exits = {}
-house2_doors = [
-    (pygame.Rect(300, 350, 32, 16), "Pallet Town", 420, 220)  # exit to near second house
-]
-house2 = Map("Pallet House 2", 600, 400, house2_walls, house2_grass, house2_wild, house2_exits, house2_doors)
-
-# House in Viridian City
-viridian_house_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(250, 150, 50, 50),  # counter
-]
-viridian_house_grass = []
-viridian_house_wild = []
-viridian_house_exits = {}
-viridian_house_doors = [
-    (pygame.Rect(300, 350, 32, 16), "Viridian City", 170, 170)  # exit to near the building in Viridian
-]
-viridian_house = Map("Viridian House", 600, 400, viridian_house_walls, viridian_house_grass, viridian_house_wild, viridian_house_exits, viridian_house_doors)
-
-# ----- Overworld Maps (with doors) -----
-
-# 1. Pallet Town (modified: houses become doors)
-pallet_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    # No house walls here; they are replaced by doors
-]
-pallet_grass = []
-pallet_wild = []
-pallet_exits = {"up": ("Route 1", 300, 380)}
-pallet_doors = [
-    (pygame.Rect(100, 100, 50, 50), "Pallet House 1", 300, 350),   # door to house1, spawn inside near door
-    (pygame.Rect(400, 200, 60, 60), "Pallet House 2", 300, 350)    # door to house2
-]
-pallet = Map("Pallet Town", 600, 400, pallet_walls, pallet_grass, pallet_wild, pallet_exits, pallet_doors)
-
-# 2. Route 1 (unchanged, no doors)
-route1_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(200, 100, 16, 16),
-    pygame.Rect(216, 100, 16, 16),
-    pygame.Rect(200, 116, 16, 16),
-]
-route1_grass = [
-    pygame.Rect(100, 200, 16, 16),
-    pygame.Rect(116, 200, 16, 16),
-    pygame.Rect(132, 200, 16, 16),
-    pygame.Rect(100, 216, 16, 16),
-    pygame.Rect(116, 216, 16, 16),
-    pygame.Rect(132, 216, 16, 16),
-    pygame.Rect(400, 300, 16, 16),
-    pygame.Rect(416, 300, 16, 16),
-    pygame.Rect(432, 300, 16, 16),
-]
-route1_wild = ["Rattata", "Pidgey"]
-route1_exits = {
-    "down": ("Pallet Town", 300, 20),
-    "up": ("Viridian City", 300, 380),
-}
-route1 = Map("Route 1", 600, 400, route1_walls, route1_grass, route1_wild, route1_exits)
-
-# 3. Viridian City (modified: add door for house)
-viridian_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    # Buildings that are not enterable? Keep one as wall, one as door
-    pygame.Rect(400, 80, 60, 60),   # this one remains a wall
-]
-viridian_grass = []
-viridian_wild = []
-viridian_exits = {
-    "down": ("Route 1", 300, 20),
-    "up": ("Route 2", 300, 380),
-}
-viridian_doors = [
-    (pygame.Rect(150, 150, 80, 40), "Viridian House", 300, 350)   # door to house
-]
-viridian = Map("Viridian City", 600, 400, viridian_walls, viridian_grass, viridian_wild, viridian_exits, viridian_doors)
-
-# 4. Route 2 (unchanged)
-route2_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(250, 150, 16, 16),
-    pygame.Rect(266, 150, 16, 16),
-]
-route2_grass = [
-    pygame.Rect(100, 100, 16, 16),
-    pygame.Rect(116, 100, 16, 16),
-    pygame.Rect(132, 100, 16, 16),
-    pygame.Rect(400, 200, 16, 16),
-    pygame.Rect(416, 200, 16, 16),
-]
-route2_wild = ["Caterpie", "Weedle", "Pidgey"]
-route2_exits = {
-    "down": ("Viridian City", 300, 20),
-    "up": ("Viridian Forest", 300, 380),
-}
-route2 = Map("Route 2", 600, 400, route2_walls, route2_grass, route2_wild, route2_exits)
-
-# 5. Viridian Forest (unchanged)
-forest_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    # Trees
-    pygame.Rect(100, 100, 16, 16),
-    pygame.Rect(116, 100, 16, 16),
-    pygame.Rect(132, 100, 16, 16),
-    pygame.Rect(148, 100, 16, 16),
-    pygame.Rect(100, 116, 16, 16),
-    pygame.Rect(148, 116, 16, 16),
-    pygame.Rect(100, 132, 16, 16),
-    pygame.Rect(148, 132, 16, 16),
-    pygame.Rect(400, 250, 16, 16),
-    pygame.Rect(416, 250, 16, 16),
-    pygame.Rect(432, 250, 16, 16),
-    pygame.Rect(400, 266, 16, 16),
-    pygame.Rect(432, 266, 16, 16),
-]
-forest_grass = [
-    pygame.Rect(200, 200, 16, 16),
-    pygame.Rect(216, 200, 16, 16),
-    pygame.Rect(232, 200, 16, 16),
-    pygame.Rect(200, 216, 16, 16),
-    pygame.Rect(232, 216, 16, 16),
-    pygame.Rect(200, 232, 16, 16),
-    pygame.Rect(216, 232, 16, 16),
-]
-forest_wild = ["Caterpie", "Metapod", "Weedle", "Kakuna", "Pikachu"]
-forest_exits = {
-    "down": ("Route 2", 300, 20),
-    "up": ("Pewter City", 300, 380),
-}
-forest = Map("Viridian Forest", 600, 400, forest_walls, forest_grass, forest_wild, forest_exits)
-
-# 6. Pewter City (add a door later if desired, but keep as is for now)
-pewter_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(80, 80, 70, 50),
-    pygame.Rect(300, 200, 80, 60),
-    pygame.Rect(450, 100, 50, 50),
-]
-pewter_grass = []
-pewter_wild = []
-pewter_exits = {
-    "down": ("Viridian Forest", 300, 20),
-    "up": ("Route 3", 300, 380),
-}
-pewter = Map("Pewter City", 600, 400, pewter_walls, pewter_grass, pewter_wild, pewter_exits)
-
-# 7. Route 3 (unchanged)
-route3_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(200, 150, 16, 16),
-    pygame.Rect(216, 150, 16, 16),
-    pygame.Rect(232, 150, 16, 16),
-    pygame.Rect(200, 166, 16, 16),
-    pygame.Rect(232, 166, 16, 16),
-]
-route3_grass = [
-    pygame.Rect(100, 200, 16, 16),
-    pygame.Rect(116, 200, 16, 16),
-    pygame.Rect(132, 200, 16, 16),
-    pygame.Rect(400, 250, 16, 16),
-    pygame.Rect(416, 250, 16, 16),
-    pygame.Rect(432, 250, 16, 16),
-]
-route3_wild = ["Jigglypuff", "Sandshrew", "Spearow"]
-route3_exits = {
-    "down": ("Pewter City", 300, 20),
-    "up": ("Mt. Moon", 300, 380),
-}
-route3 = Map("Route 3", 600, 400, route3_walls, route3_grass, route3_wild, route3_exits)
-
-# 8. Mt. Moon (unchanged)
-mtmoon_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(150, 100, 16, 16),
-    pygame.Rect(166, 100, 16, 16),
-    pygame.Rect(182, 100, 16, 16),
-    pygame.Rect(150, 116, 16, 16),
-    pygame.Rect(182, 116, 16, 16),
-    pygame.Rect(150, 132, 16, 16),
-    pygame.Rect(166, 132, 16, 16),
-    pygame.Rect(182, 132, 16, 16),
-    pygame.Rect(400, 250, 16, 16),
-    pygame.Rect(416, 250, 16, 16),
-    pygame.Rect(432, 250, 16, 16),
-]
-mtmoon_grass = [
-    pygame.Rect(250, 200, 16, 16),
-    pygame.Rect(266, 200, 16, 16),
-    pygame.Rect(282, 200, 16, 16),
-    pygame.Rect(250, 216, 16, 16),
-    pygame.Rect(282, 216, 16, 16),
-]
-mtmoon_wild = ["Zubat", "Geodude", "Paras", "Clefairy"]
-mtmoon_exits = {
-    "down": ("Route 3", 300, 20),
-    "up": ("Route 4", 300, 380),
-}
-mtmoon = Map("Mt. Moon", 600, 400, mtmoon_walls, mtmoon_grass, mtmoon_wild, mtmoon_exits)
-
-# 9. Route 4 (unchanged)
-route4_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(300, 150, 16, 16),
-    pygame.Rect(316, 150, 16, 16),
-]
-route4_grass = [
-    pygame.Rect(100, 200, 16, 16),
-    pygame.Rect(116, 200, 16, 16),
-    pygame.Rect(132, 200, 16, 16),
-    pygame.Rect(400, 250, 16, 16),
-    pygame.Rect(416, 250, 16, 16),
-    pygame.Rect(432, 250, 16, 16),
-]
-route4_wild = ["Ekans", "Sandshrew", "Mankey"]
-route4_exits = {
-    "down": ("Mt. Moon", 300, 20),
-    "up": ("Cerulean City", 300, 380),
-}
-route4 = Map("Route 4", 600, 400, route4_walls, route4_grass, route4_wild, route4_exits)
-
-# 10. Cerulean City (with a possible door later)
-cerulean_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(100, 100, 60, 50),
-    pygame.Rect(350, 200, 70, 60),
-    pygame.Rect(200, 300, 50, 40),
-]
-cerulean_grass = []
-cerulean_wild = []
-cerulean_exits = {
-    "down": ("Route 4", 300, 20),
-    "left": ("Route 5", 580, 200),
-}
-cerulean = Map("Cerulean City", 600, 400, cerulean_walls, cerulean_grass, cerulean_wild, cerulean_exits)
-
-# 11. Route 5 (unchanged)
-route5_walls = [
-    pygame.Rect(0, 0, 600, 16),
-    pygame.Rect(0, 0, 16, 400),
-    pygame.Rect(584, 0, 16, 400),
-    pygame.Rect(0, 384, 600, 16),
-    pygame.Rect(250, 150, 16, 16),
-]
-route5_grass = [
-    pygame.Rect(300, 200, 16, 16),
-    pygame.Rect(316, 200, 16, 16),
-    pygame.Rect(332, 200, 16, 16),
-]
-route5_wild = ["Meowth", "Psyduck"]
-route5_exits = {
-    "right": ("Cerulean City", 20, 200),
+        app.clock.tick(FPS)
+
+# ==================== BINARY MAP FORMAT ====================
+# .acmp files, little-endian:
+#   header   ACMP_HEADER below
+#   tables   name, encounter rate, wild list, loose rects, exits, doors
+#   layers   layer_count planes of cols*rows uint8 (walls, grass), 1 = set,
+#            starting at layers_offset (16-byte aligned)
+# Tile-aligned walls and grass that share no tile with another rect live only
+# in the layers; anything else is kept as an exact rect in the loose-rect
+# table, so conversion is lossless and survives runtime edits.
+ACMP_MAGIC = b"ACMP"
+ACMP_VERSION = 1
+ACMP_HEADER = struct.Struct("<4sHHIIIIII")  # magic, version, tile size, width, height,
+                                             # cols, rows, layer count, layers offset
+ACMP_SIDES = ("up", "down", "left", "right")
+LAYER_WALLS, LAYER_GRASS = 0, 1
+
+def _pack_str(text):
+    data = text.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+def _is_tile_aligned(rect):
+    return not (rect.x % TILE_SIZE or rect.y % TILE_SIZE or rect.w % TILE_SIZE or rect.h % TILE_SIZE)
+
+def encode_binary_map(game_map):
+    """Serialise a Map to the .acmp format; returns bytes."""
+    cols, rows = game_map.cols, game_map.rows
+    # The layers hold the map's own tiles plus the tile-aligned rects that
+    # share no tile with another rect or tile of the layer, so Map.remove_wall
+    # / remove_grass can take any of them back out exactly. They never hold
+    # Map.solid: tiles that loose walls happen to cover stay derived data.
+    layers = []
+    loose = []                            # (kind, rect) kept as exact rects
+    for kind, tiles, rects in ((LAYER_WALLS, game_map.base_solid, game_map.walls),
+                               (LAYER_GRASS, game_map.grass_tiles, game_map.grass)):
+        layer = bytearray(cols * rows) if tiles is None else bytearray(tiles)
+        blocks = []
+        cover = {}                        # tile index -> aligned rects on it
+        for rect in rects:
+            if rect and _is_tile_aligned(rect) and game_map.bounds_contain(rect):
+                col0, row0, col1, row1 = game_map._tile_span(rect)
+                block = [row * cols + col for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+                blocks.append((rect, block))
+                for index in block:
+                    cover[index] = cover.get(index, 0) + 1
+            else:
+                loose.append((kind, rect))
+        for rect, block in blocks:
+            if all(cover[index] == 1 and not (tiles is not None and tiles[index]) for index in block):
+                for index in block:
+                    layer[index] = 1
+            else:
+                loose.append((kind, rect))
+        layers.append(layer)
+    walls, grass = layers
+
+    tables = bytearray(_pack_str(game_map.name))
+    tables += struct.pack("<dH", game_map.encounter_rate, len(game_map.encounters))
+    table = game_map.encounters
+    weights = [1.0 if isinstance(e, str) else float(e[1]) for e in game_map.wild_pokemon]
+    for species, weight, levels in zip(table.species, weights, table.levels):
+        low, high = levels if levels else (-1, -1)
+        tables += _pack_str(species) + struct.pack("<dhh", weight, low, high)
+    tables += struct.pack("<I", len(loose))
+    for kind, rect in loose:
+        tables += struct.pack("<Biiii", kind, rect.x, rect.y, rect.w, rect.h)
+    tables += struct.pack("<B", len(game_map.exits))
+    for side, (target, x, y) in game_map.exits.items():
+        tables += struct.pack("<B", ACMP_SIDES.index(side)) + _pack_str(target) + struct.pack("<ii", x, y)
+    tables += struct.pack("<H", len(game_map.doors))
+    for rect, target, x, y in game_map.doors:
+        tables += struct.pack("<iiii", rect.x, rect.y, rect.w, rect.h) + _pack_str(target) + struct.pack("<ii", x, y)
+
+    layers_offset = -(-(ACMP_HEADER.size + len(tables)) // 16) * 16
+    header = ACMP_HEADER.pack(ACMP_MAGIC, ACMP_VERSION, TILE_SIZE, game_map.width, game_map.height,
+                              cols, rows, 2, layers_offset)
+    padding = bytes(layers_offset - ACMP_HEADER.size - len(tables))
+    return header + bytes(tables) + padding + bytes(walls) + bytes(grass)
+
+def write_binary_map(game_map, path):
+    with open(path, "wb") as f:
+        f.write(encode_binary_map(game_map))
+
+class BinaryMap:
+    """A memory-mapped .acmp file.
+
+    Opening one reads the header and the small tables only; the tile layers
+    are handed out as zero-copy memoryview (or NumPy) views into the mapping,
+    so even a 1024x1024-tile map costs nothing up front.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        (magic, version, tile_size, self.width, self.height, self.cols, self.rows,
+         self.layer_count, self.layers_offset) = ACMP_HEADER.unpack_from(self.mm, 0)
+        if magic != ACMP_MAGIC or version != ACMP_VERSION:
+            raise ValueError(f"{path}: not an ACMP v{ACMP_VERSION} map")
+        if tile_size != TILE_SIZE:
+            raise ValueError(f"{path}: tile size {tile_size}, this build uses {TILE_SIZE}")
+        if self.layers_offset + self.layer_count * self.cols * self.rows > len(self.mm):
+            raise ValueError(f"{path}: truncated tile layers")
+        self._read_tables(ACMP_HEADER.size)
+
+    def _read_tables(self, offset):
+        mm = self.mm
+
+        def unpack(fmt):
+            nonlocal offset
+            values = struct.unpack_from(fmt, mm, offset)
+            offset += struct.calcsize(fmt)
+            return values
+
+        def text():
+            nonlocal offset
+            (length,) = unpack("<H")
+            offset += length
+            return bytes(mm[offset - length:offset]).decode("utf-8")
+
+        self.name = text()
+        self.encounter_rate, wild_count = unpack("<dH")
+        self.wild = []
+        for _ in range(wild_count):
+            species = text()
+            weight, low, high = unpack("<dhh")
+            self.wild.append((species, weight) if low < 0 else (species, weight, (low, high)))
+        (rect_count,) = unpack("<I")
+        self.loose = [(kind, pygame.Rect(x, y, w, h))
+                      for kind, x, y, w, h in (unpack("<Biiii") for _ in range(rect_count))]
+        (exit_count,) = unpack("<B")
+        self.exits = {}
+        for _ in range(exit_count):
+            (side,) = unpack("<B")
+            target = text()
+            self.exits[ACMP_SIDES[side]] = (target,) + unpack("<ii")
+        (door_count,) = unpack("<H")
+        self.doors = []
+        for _ in range(door_count):
+            rect = pygame.Rect(unpack("<iiii"))
+            target = text()
+            self.doors.append((rect, target) + unpack("<ii"))
+
+    def layer(self, index):
+        """Zero-copy memoryview of one tile layer (cols*rows bytes, row-major)."""
+        size = self.cols * self.rows
+        start = self.layers_offset + index * size
+        return self.view[start:start + size]
+
+    def layer_array(self, index):
+        """The same layer as a read-only (rows, cols) NumPy uint8 view."""
+        if np is None:
+            raise RuntimeError("layer_array needs NumPy (pip install numpy)")
+        size = self.cols * self.rows
+        return np.frombuffer(self.mm, dtype=np.uint8, count=size,
+                             offset=self.layers_offset + index * size).reshape(self.rows, self.cols)
+
+    def definition(self):
+        """Exits, doors and wild list in the maps/*.json shape (no layers)."""
+        return {
+            "name": self.name, "width": self.width, "height": self.height,
+            "wild": [list(w) if len(w) == 2 else [w[0], w[1], list(w[2])] for w in self.wild],
+            "exits": {side: list(target) for side, target in self.exits.items()},
+            "doors": [[list(rect), target, x, y] for rect, target, x, y in self.doors],
+            "encounter_rate": self.encounter_rate,
+        }
+
+    def build(self, seed=None):
+        game_map = Map(
+            self.name, self.width, self.height,
+            [rect for kind, rect in self.loose if kind == LAYER_WALLS],
+            [rect for kind, rect in self.loose if kind == LAYER_GRASS],
+            [w if w[1] != 1.0 or len(w) > 2 else w[0] for w in self.wild],
+            dict(self.exits), list(self.doors),
+            encounter_rate=self.encounter_rate, seed=seed,
+            solid_tiles=self.layer(LAYER_WALLS), grass_tiles=self.layer(LAYER_GRASS),
+        )
+        game_map.source = self    # keeps the mapping alive as long as the map
+        return game_map
+
+def convert_maps(registry, out_dir):
+    """Write every map of a registry as .acmp plus an index.json for MapRegistry."""
+    os.makedirs(out_dir, exist_ok=True)
+    index = {}
+    for name in registry:
+        file_name = os.path.splitext(registry.index[name])[0] + ".acmp"
+        write_binary_map(registry.build(name), os.path.join(out_dir, file_name))
+        index[name] = file_name
+    with open(os.path.join(out_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    return index
+
+# ==================== MAP REGISTRY ====================
+# Map definitions live in maps/*.json (or binary .acmp files, see above);
+# maps/index.json maps each map name to its file. Nothing is parsed until a
+# door, an exit or Game() asks for it.
+MAP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maps")
+MAP_CACHE_SIZE = 8   # built maps kept resident
+
+def map_from_data(data, seed=None):
+    """Build a Map from the JSON definition format used in maps/."""
+    return Map(
+        data["name"], data["width"], data["height"],
+        [pygame.Rect(r) for r in data.get("walls", [])],
+        [pygame.Rect(r) for r in data.get("grass", [])],
+        [entry if isinstance(entry, str) else tuple(entry) for entry in data.get("wild", [])],
+        {side: tuple(target) for side, target in data.get("exits", {}).items()},
+        [(pygame.Rect(rect), target, x, y) for rect, target, x, y in data.get("doors", [])],
+        encounter_rate=data.get("encounter_rate", ENCOUNTER_RATE),
+        seed=seed,
+    )
+
+class MapRegistry:
+    """Lazy name -> Map lookup with a bounded LRU of built maps.
+
+    Maps are read and built the first time they are looked up. Once more than
+    ``capacity`` are resident the least recently visited one is dropped and
+    rebuilt from its file if it is needed again. A built map is derived data
+    only: what changes while playing (its encounter RNG and the runtime edits
+    made with Map.add_wall etc.) is kept here by name and handed to every
+    rebuild, so eviction never changes what the game does.
+    """
+
+    def __init__(self, directory=MAP_DIR, capacity=MAP_CACHE_SIZE, seed=None):
+        self.directory = directory
+        self.capacity = capacity
+        self.seed = seed
+        self.loaded = OrderedDict()   # name -> Map, least recently used first
+        self.rngs = {}                # name -> the map's encounter RNG, across rebuilds
+        self.edits = {}               # name -> the map's runtime edit log, across rebuilds
+        self.loads = 0
+        self.evictions = 0
+        self.version = 0              # bumped by reload(); lets caches over the files notice
+        self.index = self._read_index()
+
+    def _read_index(self):
+        with open(os.path.join(self.directory, "index.json"), encoding="utf-8") as f:
+            return json.load(f)  # name -> file name
+
+    def reload(self):
+        """Re-read index.json and drop every built map and its state (after the files changed on disk)."""
+        self.index = self._read_index()
+        self.loaded.clear()
+        self.rngs.clear()
+        self.edits.clear()
+        self.version += 1
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, name):
+        game_map = self.loaded.get(name)
+        if game_map is not None:
+            self.loaded.move_to_end(name)
+            return game_map
+        game_map = self.load(name)
+        self.loaded[name] = game_map
+        self.trim()
+        return game_map
+
+    def _path(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+        return os.path.join(self.directory, self.index[name])
+
+    def read(self, name):
+        """Return the definition dict of a map without building it (binary maps: no layers)."""
+        path = self._path(name)
+        if path.endswith(".acmp"):
+            return BinaryMap(path).definition()
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def adopt(self, name, game_map):
+        """Make a map from build() (a prefetch) resident, as least recently used."""
+        if name in self.loaded:
+            return self.loaded[name]
+        self._restore(name, game_map)
+        self.loaded[name] = game_map
+        self.loaded.move_to_end(name, last=False)
+        self.trim()
+        return game_map
+
+    def trim(self):
+        """Evict least recently used maps until at most capacity are resident."""
+        while len(self.loaded) > self.capacity:
+            self.loaded.popitem(last=False)
+            self.evictions += 1
+
+    def unload(self, name):
+        """Drop a built map; the next lookup rebuilds it from its file and state."""
+        return self.loaded.pop(name, None) is not None
+
+    def build(self, name):
+        """Build a map from its file alone (safe on a worker thread; see adopt)."""
+        self.loads += 1
+        path = self._path(name)
+        if path.endswith(".acmp"):
+            return BinaryMap(path).build(self.seed)
+        return map_from_data(self.read(name), self.seed)
+
+    def load(self, name):
+        """Build a map as the game would see it, without making it resident."""
+        return self._restore(name, self.build(name))
+
+    def _restore(self, name, game_map):
+        # Hand a fresh build the RNG and edits of its earlier incarnations
+        edits = self.edits.setdefault(name, [])
+        for method, args in edits:
+            getattr(game_map, method)(*args)
+        game_map.edits = edits
+        rng = self.rngs.get(name)
+        if rng is None:
+            game_map.reseed(self.seed)    # a prefetch may predate the last reseed()
+            rng = self.rngs[name] = game_map.rng
+        game_map.rng = rng
+        return game_map
+
+    def reseed(self, seed):
+        """Restart every map's encounter stream (built or not) from seed."""
+        self.seed = seed
+        self.rngs.clear()
+        for name, game_map in self.loaded.items():
+            game_map.reseed(seed)
+            self.rngs[name] = game_map.rng
+
+maps = MapRegistry()
+
+# ==================== WORLD GRAPH ====================
+# One node per map, one edge per exit or door. Built from the map definitions
+# (MapRegistry.read), so no map is built and the graph matches the files on
+# disk: runtime edits such as Map.add_door are not part of it.
+Transition = namedtuple("Transition", "source target kind via x y")
+# kind is "exit" (via: the side) or "door" (via: the door rect as a tuple);
+# x, y is where the player spawns on target.
+ROUTE_CACHE_SIZE = 256   # source maps whose shortest-path tree is kept
+
+class WorldGraph:
+    """Routes between maps over exits and doors.
+
+    Paths are shortest in number of transitions. Each source map gets one BFS
+    tree on first use and the trees are kept in an LRU, so repeated queries
+    from the same map are a walk up the tree. Everything is rebuilt when the
+    registry is reloaded (MapRegistry.version) or the global ``maps`` is
+    replaced (--map-dir).
+    """
+
+    def __init__(self, registry=None, cache_size=ROUTE_CACHE_SIZE):
+        self._registry = registry     # None: whatever the global maps is at query time
+        self.cache_size = cache_size
+        self._key = None
+        self.edges = {}               # name -> [Transition]
+        self.dangling = []            # transitions whose target is not in the registry
+        self.trees = OrderedDict()    # source -> {name: Transition that first reached it}
+        self.builds = 0
+
+    @property
+    def registry(self):
+        return maps if self._registry is None else self._registry
+
+    def _current(self):
+        registry = self.registry
+        key = (id(registry), registry.version)
+        if key != self._key:
+            self._build(registry)
+            self._key = key
+        return registry
+
+    def _build(self, registry):
+        edges, dangling = {}, []
+        for name in registry:
+            data = registry.read(name)
+            out = []
+            for side, (target, x, y) in data.get("exits", {}).items():
+                out.append(Transition(name, target, "exit", side, x, y))
+            for rect, target, x, y in data.get("doors", []):
+                out.append(Transition(name, target, "door", tuple(rect), x, y))
+            edges[name] = [t for t in out if t.target in registry]
+            dangling += [t for t in out if t.target not in registry]
+        self.edges = edges
+        self.dangling = dangling
+        self.trees.clear()
+        self.builds += 1
+
+    def invalidate(self):
+        self._key = None
+
+    def neighbours(self, name):
+        self._current()
+        return list(self.edges[name])
+
+    def _tree(self, source):
+        tree = self.trees.get(source)
+        if tree is not None:
+            self.trees.move_to_end(source)
+            return tree
+        if source not in self.edges:
+            raise KeyError(source)
+        tree = {source: None}
+        queue = deque([source])
+        edges = self.edges
+        while queue:
+            name = queue.popleft()
+            for transition in edges[name]:
+                if transition.target not in tree:
+                    tree[transition.target] = transition
+                    queue.append(transition.target)
+        self.trees[source] = tree
+        while len(self.trees) > self.cache_size:
+            self.trees.popitem(last=False)
+        return tree
+
+    def route(self, source, target):
+        """Transitions leading from source to target ([] if equal), or None if unreachable."""
+        self._current()
+        tree = self._tree(source)
+        if target not in tree:
+            if target not in self.edges:
+                raise KeyError(target)
+            return None
+        path = []
+        while target != source:
+            transition = tree[target]
+            path.append(transition)
+            target = transition.source
+        path.reverse()
+        return path
+
+    def distance(self, source, target):
+        path = self.route(source, target)
+        return None if path is None else len(path)
+
+    def reachable(self, source):
+        """Every map that can be reached from source (source included)."""
+        self._current()
+        return set(self._tree(source))
+
+world = WorldGraph()
+
+# ==================== GAME STATE ====================
+class Game:
+    """Overworld and battle state, advanced one tick at a time.
+
+    tick() is the whole per-frame logic of the main loop (movement, battles,
+    door and edge transitions) without any event polling or drawing, so it
+    can be driven by the real keyboard or by a scripted input source.
+    """
+
+    def __init__(self, start_map="Pallet Town", x=300, y=200, seed=None):
+        if seed is not None:
+            seed_world(seed)
+        self.current_map = maps[start_map]
+        self.map_name = start_map  # registry name of current_map (its file may name it otherwise)
+        self.player = Player(x, y)
+        self.battle = None
+        self.ticks = 0
+        self.battles = 0       # battles started
+        self.map_changes = 0
+        self.exit_side = None  # side of the edge exit that caused the last map change
+
+    def fingerprint(self):
+        """CRC32 of the observable game state, to check that two runs ended identically."""
+        battle = self.battle
+        state = (self.current_map.name, self.player.rect.topleft, self.player.in_battle,
+                 self.ticks, self.battles, self.map_changes,
+                 battle and (battle.wild_pokemon["name"], battle.wild_pokemon["hp"],
+                             battle.player_pokemon["hp"], battle.turn, battle.battle_over))
+        return zlib.crc32(repr(state).encode("utf-8"))
+
+    def enter_map(self, name, x, y):
+        self.current_map = maps[name]
+        self.map_name = name
+        self.player.set_position(x, y)  # fixed: update both rect and x,y
+        self.map_changes += 1
+
+    def tick(self, keys, pressed=()):
+        """Advance one tick. keys: held-key state, pressed: keys that went down this tick."""
+        if self.update(keys, pressed):
+            self.check_transitions()
+
+    def update(self, keys, pressed=()):
+        """Battle or overworld step of tick(); True if map transitions need checking."""
+        player = self.player
+        player.prev_pos = player.rect.topleft
+        self.ticks += 1
+        if pygame.K_SPACE in pressed and self.battle and self.battle.battle_over:
+            player.in_battle = False
+            self.battle = None
+
+        if player.in_battle and self.battle is None:
+            # Start a new battle if just entered battle mode
+            game_map = self.current_map
+            self.battle = Battle(player, game_map.encounters.sample(game_map.rng))
+            self.battles += 1
+
+        if self.battle:
+            self.battle.handle_input(keys)
+            self.battle.update()
+            return False
+
+        # Overworld movement
+        new_battle = player.update(keys, self.current_map)
+        if new_battle:
+            self.battle = new_battle
+            self.battles += 1
+        return True
+
+    def check_transitions(self):
+        """Door and edge transitions for the player's current position."""
+        player = self.player
+        # Check door transitions (only a step can put us on a door)
+        door_result = player.probe.door if player.moved else None
+        if door_result:
+            target_map, spawn_x, spawn_y = door_result
+            if target_map in maps:
+                self.exit_side = None
+                self.enter_map(target_map, spawn_x, spawn_y)
+            return
+
+        # Edge transitions
+        rect = player.rect
+        exits = self.current_map.exits
+        if rect.top <= 0 and "up" in exits:
+            side = "up"
+        elif rect.bottom >= self.current_map.height and "down" in exits:
+            side = "down"
+        elif rect.left <= 0 and "left" in exits:
+            side = "left"
+        elif rect.right >= self.current_map.width and "right" in exits:
+            side = "right"
+        else:
+            return
+        if exits[side][0] not in maps:
+            return  # dangling exit (see WorldGraph.dangling): stay, like a door to nowhere
+        self.exit_side = side
+        self.enter_map(*exits[side])
+
+# ==================== WORLD STREAMING ====================
+STREAM_RADIUS = 1      # maps kept resident: this many transitions from the player's map
+SCROLL_TIME = 0.3      # seconds an edge transition scrolls for in streaming mode
+# Direction the screen content moves in while scrolling through each exit
+SCROLL_DIRECTIONS = {"up": (0, 1), "down": (0, -1), "left": (1, 0), "right": (-1, 0)}
+
+class MapStreamer:
+    """Keeps the maps around the player built and pre-rendered.
+
+    focus(name) is called with the player's map: every map within ``radius``
+    transitions (exits and doors alike) that is not resident is read and
+    built on a worker thread, and every resident map further away is
+    unloaded. Transitions are read off maps that are already built, so no
+    other map file is opened to find them; with a radius above 1 the
+    neighbourhood grows as the maps nearer in arrive. poll(), once per frame
+    on the main thread, hands finished maps to the registry and pre-renders
+    at most one background, so by the time the player reaches an exit the
+    next map costs a blit.
+    """
+
+    def __init__(self, registry=None, radius=STREAM_RADIUS):
+        self._registry = registry     # None: the global maps
+        self.radius = radius
+        # Imported here, not at the top: only --stream needs the worker thread
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-stream")
+        self.pending = {}             # name -> Future of a Map
+        self.center = None
+        self.keep = set()
+        self.capacity = None          # the registry's own capacity while focus() has raised it
+        self.prefetches = 0
+        self.unloads = 0
+
+    @property
+    def registry(self):
+        return maps if self._registry is None else self._registry
+
+    def nearby(self, name):
+        """Maps at most radius transitions from name (name included), as far
+        as the exits and doors of the resident maps tell."""
+        registry = self.registry
+        loaded = registry.loaded
+        found = {name}
+        frontier = [name]
+        for _ in range(self.radius):
+            targets = set()
+            for game_map in (loaded.get(n) for n in frontier):
+                if game_map is not None:
+                    targets.update(target for target, _, _ in game_map.exits.values())
+                    targets.update(door[1] for door in game_map.doors)
+            frontier = [t for t in targets if t not in found and t in registry]
+            found.update(frontier)
+        return found
+
+    def focus(self, name):
+        if name == self.center:
+            return
+        self.center = name
+        self.keep = keep = self.nearby(name)
+        registry = self.registry
+        # Room for the whole neighbourhood, so prefetches never push out each other
+        if self.capacity is None:
+            self.capacity = registry.capacity
+        registry.capacity = max(self.capacity, len(keep) + 1)
+        for other in list(registry.loaded):
+            if other not in keep and registry.unload(other):
+                self.unloads += 1
+        for other in keep:
+            if other not in registry.loaded and other not in self.pending:
+                self.pending[other] = self.executor.submit(registry.build, other)
+                self.prefetches += 1
+
+    def poll(self):
+        registry = self.registry
+        adopted = False
+        for name in [n for n, future in self.pending.items() if future.done()]:
+            game_map = self.pending.pop(name).result()
+            if name in self.keep:
+                registry.adopt(name, game_map)
+                adopted = True
+        if adopted and self.radius > 1:
+            # the new maps' own exits and doors reach further out
+            center, self.center = self.center, None
+            self.focus(center)
+        for name in self.keep:
+            game_map = registry.loaded.get(name)
+            if game_map is not None and game_map.prerender():
+                break                 # one background per frame
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.capacity is not None:
+            self.registry.capacity = self.capacity
+            self.registry.trim()
+            self.capacity = None
+
+# ==================== SCRIPTED INPUT ====================
+KEY_NAMES = {
+    "up": pygame.K_UP, "down": pygame.K_DOWN, "left": pygame.K_LEFT, "right": pygame.K_RIGHT,
+    "a": pygame.K_a, "space": pygame.K_SPACE, "return": pygame.K_RETURN,
 }
-route5 = Map("Route 5", 600, 400, route5_walls, route5_grass, route5_wild, route5_exits)
-
-# ==================== MAP DICTIONARY ====================
-maps = {
-    "Pallet Town": pallet,
-    "Pallet House 1": house1,
-    "Pallet House 2": house2,
-    "Route 1": route1,
-    "Viridian City": viridian,
-    "Viridian House": viridian_house,
-    "Route 2": route2,
-    "Viridian Forest": forest,
-    "Pewter City": pewter,
-    "Route 3": route3,
-    "Mt. Moon": mtmoon,
-    "Route 4": route4,
-    "Cerulean City": cerulean,
-    "Route 5": route5,
+
+class KeyState:
+    """Stand-in for pygame.key.get_pressed(): indexable by key constant."""
+    __slots__ = ("held",)
+
+    def __init__(self, held=()):
+        self.held = frozenset(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+class ScriptedInput:
+    """Replays a key script, looping it for as long as ticks are asked for.
+
+    One step per line: ``<ticks> [key ...]`` holds those keys (names from
+    KEY_NAMES) for that many ticks (at least 1); a bare count idles. ``#`` starts a comment.
+    Yields (KeyState, pressed) per tick, where pressed holds the keys that
+    went down on that tick, as pygame.KEYDOWN would report them.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps    # list of (ticks, frozenset of key constants)
+
+    @classmethod
+    def from_file(cls, path):
+        steps = []
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                fields = line.split("#", 1)[0].split()
+                if not fields:
+                    continue
+                try:
+                    count = int(fields[0])
+                    held = frozenset(KEY_NAMES[name.lower()] for name in fields[1:])
+                except (ValueError, KeyError) as exc:
+                    raise ValueError(f"{path}:{lineno}: bad script line {line.strip()!r}") from exc
+                if count < 1:   # a script of only such steps would loop without yielding
+                    raise ValueError(f"{path}:{lineno}: tick count must be at least 1 in {line.strip()!r}")
+                steps.append((count, held))
+        if not steps:
+            raise ValueError(f"{path}: empty input script")
+        return cls(steps)
+
+    def __iter__(self):
+        previous = frozenset()
+        while True:
+            for count, held in self.steps:
+                state = KeyState(held)
+                for i in range(count):
+                    yield state, (held - previous if i == 0 else ())
+                    previous = held
+
+class RandomInput:
+    """Seeded random walker: holds one direction (or A / SPACE) for a few ticks at a time."""
+
+    CHOICES = [(), (pygame.K_UP,), (pygame.K_DOWN,), (pygame.K_LEFT,), (pygame.K_RIGHT,),
+               (pygame.K_a,), (pygame.K_SPACE,)]
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def __iter__(self):
+        rng = self.rng
+        previous = frozenset()
+        while True:
+            held = frozenset(rng.choice(self.CHOICES))
+            state = KeyState(held)
+            for i in range(rng.randint(1, 8)):
+                yield state, (held - previous if i == 0 else ())
+                previous = held
+
+# ==================== INPUT RECORDING ====================
+# .acrp files, little-endian: a header, then the session as runs of identical
+# ticks. Each run is a LEB128 tick count, the held-key mask and the pressed-key
+# mask (one bit per REPLAY_KEYS entry). Holding a direction for a second is one
+# 3-byte run instead of 60 ticks.
+#
+#   header  magic "ACRP", u16 version, i64 seed, u32 ticks, u32 fingerprint
+#   runs    (varint count, u8 held, u8 pressed) until the end of the file
+REPLAY_MAGIC = b"ACRP"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sHqII")
+REPLAY_KEYS = tuple(KEY_NAMES.values())   # every key the game logic reads
+
+def _key_mask(keys):
+    mask = 0
+    for bit, key in enumerate(REPLAY_KEYS):
+        if keys[key]:
+            mask |= 1 << bit
+    return mask
+
+def _pressed_mask(pressed):
+    mask = 0
+    for bit, key in enumerate(REPLAY_KEYS):
+        if key in pressed:
+            mask |= 1 << bit
+    return mask
+
+def _mask_keys(mask):
+    return frozenset(key for bit, key in enumerate(REPLAY_KEYS) if mask >> bit & 1)
+
+class InputRecorder:
+    """Collects the (keys, pressed) pair of every logic tick for a .acrp file.
+
+    keys is anything indexable by key constant (pygame.key.get_pressed(),
+    KeyState); pressed holds the KEYDOWN keys the tick saw. Only REPLAY_KEYS
+    are kept: nothing else reaches Game.tick().
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.runs = []        # [count, held mask, pressed mask]
+        self.ticks = 0
+
+    def record(self, keys, pressed):
+        held, down = _key_mask(keys), _pressed_mask(pressed)
+        runs = self.runs
+        if runs and runs[-1][1] == held and runs[-1][2] == down:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, held, down])
+        self.ticks += 1
+
+    def wrap(self, inputs):
+        """Pass an input source through unchanged, recording every tick taken from it."""
+        for keys, pressed in inputs:
+            self.record(keys, pressed)
+            yield keys, pressed
+
+    def encode(self, fingerprint=0):
+        out = bytearray(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.ticks, fingerprint))
+        for count, held, down in self.runs:
+            while count >= 0x80:
+                out.append(count & 0x7F | 0x80)
+                count >>= 7
+            out += bytes((count, held, down))
+        return bytes(out)
+
+    def save(self, path, fingerprint=0):
+        """Write the recording; fingerprint is Game.fingerprint() at the last tick."""
+        with open(path, "wb") as f:
+            f.write(self.encode(fingerprint))
+
+class Replay:
+    """A recorded session: seed, tick count and the final-state fingerprint.
+
+    Iterating yields (KeyState, pressed) per tick exactly as they were
+    recorded, then stops, so it drops in wherever ScriptedInput does.
+    """
+
+    def __init__(self, seed, ticks, fingerprint, runs):
+        self.seed = seed
+        self.ticks = ticks
+        self.fingerprint = fingerprint
+        self.runs = runs      # [(count, held mask, pressed mask)]
+
+    @classmethod
+    def decode(cls, data, source="<replay>"):
+        if len(data) < REPLAY_HEADER.size:
+            raise ValueError(f"{source}: truncated replay")
+        magic, version, seed, ticks, fingerprint = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError(f"{source}: not a replay file")
+        if version != REPLAY_VERSION:
+            raise ValueError(f"{source}: unsupported replay version {version}")
+        runs = []
+        pos, end = REPLAY_HEADER.size, len(data)
+        while pos < end:
+            count = shift = 0
+            while True:
+                if pos >= end:
+                    raise ValueError(f"{source}: truncated replay")
+                byte = data[pos]
+                pos += 1
+                count |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            if pos + 2 > end:
+                raise ValueError(f"{source}: truncated replay")
+            runs.append((count, data[pos], data[pos + 1]))
+            pos += 2
+        if sum(run[0] for run in runs) != ticks:
+            raise ValueError(f"{source}: tick count does not match the header")
+        return cls(seed, ticks, fingerprint, runs)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as f:
+            return cls.decode(f.read(), path)
+
+    def __len__(self):
+        return self.ticks
+
+    def __iter__(self):
+        for count, held, down in self.runs:
+            state = KeyState(_mask_keys(held))
+            pressed = _mask_keys(down)
+            for _ in range(count):
+                yield state, pressed
+
+# ==================== HEADLESS SIMULATION ====================
+def run_headless(ticks, inputs=None, seed=0, recorder=None):
+    """Step the game as fast as the CPU allows, with no rendering or frame cap.
+
+    ticks is the tick budget; inputs an iterable of (keys, pressed) pairs
+    (ScriptedInput, RandomInput, Replay...). recorder, an InputRecorder, is
+    fed every tick. Returns a stats dict with ticks/second.
+    """
+    if inputs is None:
+        inputs = RandomInput(seed)
+    game = Game(seed=seed)
+    tick = game.tick
+    source = iter(inputs if recorder is None else recorder.wrap(inputs))
+    start = time.perf_counter()
+    for _ in range(ticks):
+        keys, pressed = next(source)
+        tick(keys, pressed)
+    elapsed = time.perf_counter() - start
+    return {
+        "ticks": game.ticks,
+        "seconds": elapsed,
+        "ticks_per_second": game.ticks / elapsed if elapsed > 0 else float("inf"),
+        "battles": game.battles,
+        "map_changes": game.map_changes,
+        "final_map": game.current_map.name,
+        "fingerprint": game.fingerprint(),
+    }
+
+# ==================== AGENT ENVIRONMENT ====================
+# Gym-style wrapper around Game for agent training: one step() is one logic
+# tick with one action held. Nothing is drawn and no display is needed.
+ENV_ACTIONS = ("noop", "up", "down", "left", "right", "a", "space")
+ENV_REWARDS = {
+    "tile": 0.01,      # first visit to a tile this episode
+    "map": 1.0,        # first visit to a map this episode
+    "win": 1.0,        # a battle won
+    "loss": -1.0,      # a battle lost (also ends the episode)
 }
+ENV_MAX_STEPS = 10000  # episodes are truncated after this many steps
+
+# map: index in the registry, x/y: player tile, battle: 0 overworld, 1 fighting,
+# 2 won, 3 lost (SPACE leaves), hp/wild_hp: 0 outside battles
+Observation = namedtuple("Observation", "map x y battle hp wild_hp")
+
+class GameEnv:
+    """reset(seed) -> (observation, info); step(action) -> (observation,
+    reward, terminated, truncated, info), as in Gymnasium.
+
+    action is an index into ENV_ACTIONS (or its name). It is held for the
+    step, and counts as pressed only if the previous step held something
+    else, like a real KEYDOWN: SPACE leaves a finished battle on the step it
+    is first chosen. The map encounter RNGs live in the global registry, so
+    envs in one process share them; run one env per process for independent
+    streams.
+    """
+
+    actions = ENV_ACTIONS
+
+    def __init__(self, start_map="Pallet Town", x=300, y=200, max_steps=ENV_MAX_STEPS, rewards=None):
+        self.start = (start_map, x, y)
+        self.max_steps = max_steps
+        self.rewards = dict(ENV_REWARDS, **(rewards or {}))
+        self.map_ids = {name: i for i, name in enumerate(maps)}
+        held = [frozenset(KEY_NAMES[name] for name in (action,) if name in KEY_NAMES)
+                for action in ENV_ACTIONS]
+        self._keys = [KeyState(keys) for keys in held]
+        # _pressed[previous][action]: the keys that went down this step
+        self._pressed = [[tuple(now - before) for now in held] for before in held]
+        self.game = None
+
+    def reset(self, seed=None):
+        """Start an episode; seed reseeds every map's encounter stream."""
+        start_map, x, y = self.start
+        self.game = Game(start_map, x, y, seed)
+        self.steps = 0
+        self.total_reward = 0.0
+        self._previous = 0
+        self._scored = None     # the finished battle already rewarded
+        self._maps = {start_map}
+        self._tiles = {(start_map, x, y)}
+        return self.observation(), self.info()
+
+    def step(self, action):
+        if self.game is None:
+            raise RuntimeError("call reset() before step()")
+        if isinstance(action, str):
+            action = ENV_ACTIONS.index(action)
+        game = self.game
+        game.tick(self._keys[action], self._pressed[self._previous][action])
+        self._previous = action
+        self.steps += 1
+
+        rewards = self.rewards
+        reward = 0.0
+        terminated = False
+        battle = game.battle
+        if battle is None:
+            name = game.map_name
+            if name not in self._maps:
+                self._maps.add(name)
+                reward += rewards["map"]
+            tile = (name,) + game.player.rect.topleft
+            if tile not in self._tiles:
+                self._tiles.add(tile)
+                reward += rewards["tile"]
+        elif battle.battle_over:
+            if battle is not self._scored:
+                self._scored = battle
+                reward += rewards["win"] if battle.player_won else rewards["loss"]
+            terminated = not battle.player_won
+        self.total_reward += reward
+        truncated = self.steps >= self.max_steps
+        return self.observation(), reward, terminated, truncated, self.info()
+
+    def observation(self):
+        game = self.game
+        rect = game.player.rect
+        battle = game.battle
+        if battle is None:
+            state = hp = wild_hp = 0
+        else:
+            state = (3 - battle.player_won) if battle.battle_over else 1
+            hp, wild_hp = battle.player_pokemon["hp"], battle.wild_pokemon["hp"]
+        return Observation(self.map_ids[game.map_name], rect.x // TILE_SIZE, rect.y // TILE_SIZE,
+                           state, hp, wild_hp)
+
+    def info(self):
+        game = self.game
+        return {"map": game.map_name, "steps": self.steps, "battles": game.battles,
+                "map_changes": game.map_changes, "tiles": len(self._tiles)}
+
+def run_env(steps, seed=0):
+    """Drive a GameEnv with seeded random actions; returns steps/second and episode stats."""
+    env = GameEnv()
+    rng = random.Random(seed)
+    choice, count = rng.randrange, len(ENV_ACTIONS)
+    env.reset(seed)
+    step = env.step
+    episodes, best = 0, 0.0
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, terminated, truncated, _ = step(choice(count))
+        if terminated or truncated:
+            episodes += 1
+            best = max(best, env.total_reward)
+            env.reset()
+    elapsed = time.perf_counter() - start
+    return {
+        "steps": steps,
+        "seconds": elapsed,
+        "steps_per_second": steps / elapsed if elapsed > 0 else float("inf"),
+        "episodes": episodes,
+        "best_return": max(best, env.total_reward),
+    }
+
+# ==================== BATCH BATTLE SIMULATOR ====================
+def simulate_battles(player_hp, player_attack, wild_hp, wild_attack, n=None, max_turns=1000):
+    """Run N battles in lockstep with NumPy, using the same rules as Battle.
+
+    Each stat may be a scalar or an array broadcastable to N battles. The
+    player always strikes first, as in Battle; a round is one player attack
+    and, if the wild Pokémon is still up, one enemy attack. Battles still
+    running after max_turns attacks are reported as undecided.
+
+    Returns a dict with the win rate, per-battle arrays (won, turns, the
+    winner's remaining HP) and histograms of turns-to-KO and remaining HP.
+    """
+    if np is None:
+        raise RuntimeError("simulate_battles needs NumPy (pip install numpy)")
+    stats = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in
+                                  (player_hp, player_attack, wild_hp, wild_attack)))
+    if n is None:
+        n = stats[0].size if stats[0].ndim else 1
+    p_hp, p_atk, w_hp, w_atk = (np.broadcast_to(v, (n,)).copy() for v in stats)
+    p_dmg = attack_damage(p_atk)
+    w_dmg = attack_damage(w_atk)
+
+    won = np.zeros(n, dtype=bool)
+    turns = np.zeros(n, dtype=np.int64)
+    active = np.arange(n)
+    turn = 0
+    while active.size and turn < max_turns:
+        # Player's attack
+        turn += 1
+        w_hp[active] -= p_dmg[active]
+        fainted = w_hp[active] <= 0
+        done = active[fainted]
+        won[done] = True
+        turns[done] = turn
+        active = active[~fainted]
+        if not active.size or turn >= max_turns:
+            break
+        # Enemy's answer
+        turn += 1
+        p_hp[active] -= w_dmg[active]
+        fainted = p_hp[active] <= 0
+        turns[active[fainted]] = turn
+        active = active[~fainted]
+
+    decided = np.ones(n, dtype=bool)
+    decided[active] = False
+    np.maximum(p_hp, 0, out=p_hp)
+    np.maximum(w_hp, 0, out=w_hp)
+    remaining = np.where(won, p_hp, w_hp)  # HP left on the winning side
+    wins = int(won.sum())
+    return {
+        "n": n,
+        "wins": wins,
+        "losses": int(decided.sum()) - wins,
+        "undecided": int(active.size),
+        "win_rate": wins / n if n else 0.0,
+        "won": won,
+        "turns": turns,
+        "remaining_hp": remaining,
+        "turns_hist": np.bincount(turns[decided], minlength=1),
+        "player_hp_hist": np.bincount(remaining[won], minlength=1),
+        "wild_hp_hist": np.bincount(remaining[decided & ~won], minlength=1),
+    }
+
+def sample_battle_stats(n, seed=0, hp=(10, 30), attack=(4, 14)):
+    """Seeded random (player_hp, player_attack, wild_hp, wild_attack) arrays, ranges inclusive."""
+    if np is None:
+        raise RuntimeError("sample_battle_stats needs NumPy (pip install numpy)")
+    rng = np.random.default_rng(seed)
+    return (rng.integers(hp[0], hp[1], n, endpoint=True),
+            rng.integers(attack[0], attack[1], n, endpoint=True),
+            rng.integers(hp[0], hp[1], n, endpoint=True),
+            rng.integers(attack[0], attack[1], n, endpoint=True))
+
+# ==================== BATCHED WORLD ====================
+# N independent games in NumPy arrays, stepped together. A player only ever
+# stands on the 16px lattice of the point it entered a map at (see
+# PATHFINDING), so each (map, lattice offset) that instances reach gets a
+# lookup table with one byte per lattice position, built on first entry. A
+# move check, a grass probe and a door probe are then one gather for all
+# instances at once.
+BATCH_RNG_BLOCK = 256   # encounter draws buffered per (instance, map) stream
+BATCH_CHECK_SIZE = 64   # instances run_batch steps through GameEnv to time the scalar game
+BATCH_TICKS = 1000      # ticks run by --batch
+BATCH_START = "Route 1" # start map of --batch: it has grass, so encounters and battles get exercised
+
+class BatchWorld:
+    """N games stepped in lockstep: step(actions) is Game.tick() for all of them.
+
+    Instance i plays by the rules of Game(start_map, x, y) fed ENV_ACTIONS
+    the way GameEnv feeds them. State lives in arrays: map index, pixel
+    position, battle flags and HP per instance. Maps are taken from the
+    registry the first time an instance enters them, as they are then, so
+    memory follows the maps actually visited.
+
+    Encounter rolls come from one NumPy generator per map, drawn for all the
+    instances stepping onto that map's grass in a tick at once. With
+    exact=True they come instead from the scalar game's own per-map streams
+    (random.Random seeded "seed + i:map name", buffered per (instance, map)):
+    instance i then ends every tick in the same state as Game(start_map, x,
+    y, seed=seed + i) (fingerprint(i) == Game.fingerprint()), at the cost of
+    seeding and refilling one Python stream per instance and map.
+    """
+
+    P_DAMAGE = attack_damage(PLAYER_STATS["attack"])
+    W_DAMAGE = attack_damage(WILD_STATS["attack"])
+    A, SPACE = ENV_ACTIONS.index("a"), ENV_ACTIONS.index("space")
+    FIRST_FILL = 8          # draws in a stream's first buffer fill; each refill doubles it
+    SHIFT = TILE_SIZE.bit_length() - 1   # lattice steps are TILE_SIZE, a power of two
+
+    def __init__(self, n, seed=0, start_map="Pallet Town", x=300, y=200, registry=None, exact=False):
+        if np is None:
+            raise RuntimeError("BatchWorld needs NumPy (pip install numpy)")
+        self.registry = registry if registry is not None else maps
+        self.n = n
+        self.seed = seed
+        self.exact = exact
+        self.names = list(self.registry)              # registry names; index = map id, as in GameEnv
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        count = len(self.names)
+        speed = Player(0, 0).speed
+        steps = {"up": (0, -speed), "down": (0, speed), "left": (-speed, 0), "right": (speed, 0)}
+        self.STEP = np.array([steps.get(a, (0, 0)) for a in ENV_ACTIONS], np.int32).T   # (x, y) rows
+        self.MOVES = np.array([a in steps for a in ENV_ACTIONS])
+
+        # per map, filled in by _load_map() when an instance first enters it
+        self.loaded = np.zeros(count, bool)
+        self.map_names = [None] * count                # Map.name, which seeds the encounter streams...
+        self.generators = [None] * count               # ...or the map's NumPy generator (exact=False)
+        # exit target -1: no exit on that side, -2: an exit to a map the registry lacks
+        self.exit_target = np.full((count, len(ACMP_SIDES)), -1, np.int64)
+        self.exit_x = np.zeros((count, len(ACMP_SIDES)), np.int64)
+        self.exit_y = np.zeros((count, len(ACMP_SIDES)), np.int64)
+        # positions from which an edge exit is taken to the right / bottom
+        self.map_right = np.zeros(count, np.int64)
+        self.map_bottom = np.zeros(count, np.int64)
+        self.rate = np.zeros(count)
+        self.enc_size = np.zeros(count, np.int64)
+        self.enc_off = np.zeros(count, np.int64)
+        self.prob = np.zeros(0)
+        self.keep = np.zeros(0, np.int64)
+        self.alias = np.zeros(0, np.int64)
+        self.species = []
+        self.species_ids = {}
+        self.door_base = np.zeros(count, np.int64)     # first entry of each map's doors below
+        self.door_target = np.zeros(0, np.int64)       # -1: a door to a map the registry lacks
+        self.door_x = np.zeros(0, np.int64)
+        self.door_y = np.zeros(0, np.int64)
+        # per (map, lattice offset), filled in by _build_table()
+        self.table_of = np.full((count, TILE_SIZE, TILE_SIZE), -1, np.int32)
+        # rows per table: x0, y0, last column, last row, width, offset into flags
+        self.table_geometry = np.zeros((6, 0), np.int32)
+        self.flags = np.zeros(0, np.uint8)
+        self.door_cell = np.zeros(0, np.int64)         # flags index of every ON_DOOR position, ascending...
+        self.door_id = np.zeros(0, np.int32)           # ...and the door found there
+
+        start = self.ids[start_map]
+        self.map = np.full(n, start, np.int64)
+        # one row per coordinate (and per geometry field below): whole-row
+        # operations on contiguous arrays are several times faster than on
+        # (n, 2), and int32 halves the work again
+        self.xy = np.empty((2, n), np.int32)
+        self.xy[0], self.xy[1] = x, y
+        self.x, self.y = self.xy                       # views
+        self.recheck = np.ones(n, bool)                # edge exits to check even without a step
+        self.previous = np.zeros(n, np.int64)          # last action, for SPACE presses
+        self.in_battle = np.zeros(n, bool)
+        self.battle_over = np.zeros(n, bool)
+        self.player_won = np.zeros(n, bool)
+        self.enemy_turn = np.zeros(n, bool)
+        self.hp = np.zeros(n, np.int64)
+        self.wild_hp = np.zeros(n, np.int64)
+        self.wild = np.zeros(n, np.int64)              # species id of the wild Pokémon
+        self.battles = np.zeros(n, np.int64)
+        self.map_changes = np.zeros(n, np.int64)
+        self.ticks = 0
+        # the current table's geometry per instance, refreshed by _enter()
+        tables = self._tables(self.map, self.x, self.y)   # (grows table_geometry)
+        self.geometry = self.table_geometry.take(tables, axis=1)
+        # exact=True encounter streams: slot per (instance, map), buffered draws per slot
+        self.slot = np.full((n, count), -1, np.int32)
+        self.buffer = np.zeros((0, BATCH_RNG_BLOCK))
+        self.draw_pos = np.zeros(0, np.int64)          # next unused draw...
+        self.draw_end = np.zeros(0, np.int64)          # ...and the end of the buffered ones
+        self.streams = []      # per slot: [random.Random or None, instance, map id, next fill size]
+
+    def _load_map(self, m):
+        game_map = self.registry[self.names[m]]
+        self.loaded[m] = True
+        self.map_names[m] = game_map.name
+        if not self.exact:
+            self.generators[m] = np.random.default_rng([self.seed, zlib.crc32(game_map.name.encode())])
+        self.door_base[m] = len(self.door_target)
+        if game_map.doors:
+            _, targets, xs, ys = zip(*game_map.doors)
+            self.door_target = np.concatenate([self.door_target, [self.ids.get(t, -1) for t in targets]])
+            self.door_x = np.concatenate([self.door_x, xs])
+            self.door_y = np.concatenate([self.door_y, ys])
+        for s, side in enumerate(ACMP_SIDES):
+            target = game_map.exits.get(side)
+            if target is not None:
+                self.exit_target[m, s] = self.ids.get(target[0], -2)
+                self.exit_x[m, s], self.exit_y[m, s] = target[1], target[2]
+        self.map_right[m] = game_map.width - TILE_SIZE
+        self.map_bottom[m] = game_map.height - TILE_SIZE
+        table = game_map.encounters
+        for species in table.species:
+            if species not in self.species_ids:
+                self.species_ids[species] = len(self.species)
+                self.species.append(species)
+        self.rate[m] = game_map.encounter_rate
+        self.enc_size[m] = len(table)
+        self.enc_off[m] = len(self.prob)
+        self.prob = np.concatenate([self.prob, table.prob])
+        self.keep = np.concatenate([self.keep, [self.species_ids[s] for s in table.species]]).astype(np.int64)
+        self.alias = np.concatenate([self.alias, [self.species_ids[table.species[a]] for a in table.alias]]).astype(np.int64)
+
+    def _build_table(self, m, ox, oy):
+        if not self.loaded[m]:
+            self._load_map(m)
+        x0, y0, flags, door_cells, door_ids = _lattice_table(self.registry[self.names[m]], ox, oy)
+        h, w = flags.shape
+        offset = self.flags.size
+        self.table_of[m, ox, oy] = self.table_geometry.shape[1]
+        geometry = np.array([x0, y0, w - 1, h - 1, w, offset], np.int32)
+        self.table_geometry = np.column_stack([self.table_geometry, geometry])
+        self.flags = np.concatenate([self.flags, flags.ravel()])
+        self.door_cell = np.concatenate([self.door_cell, door_cells + offset])
+        self.door_id = np.concatenate([self.door_id, (door_ids + self.door_base[m]).astype(np.int32)])
+
+    def _tables(self, m, x, y):
+        """Table ids for instances on maps m at x, y, building any that are missing."""
+        ox, oy = x % TILE_SIZE, y % TILE_SIZE
+        tables = self.table_of[m, ox, oy]
+        missing = tables < 0
+        if missing.any():
+            for key in set(zip(m[missing].tolist(), ox[missing].tolist(), oy[missing].tolist())):
+                self._build_table(*key)
+            tables = self.table_of[m, ox, oy]
+        return tables
+
+    def table_bytes(self):
+        """Memory held by the lookup tables, in bytes."""
+        return self.flags.nbytes + self.door_cell.nbytes + self.door_id.nbytes + self.table_of.nbytes
+
+    def step(self, actions):
+        """Advance every instance one tick; actions holds an ENV_ACTIONS index per instance."""
+        actions = np.array(actions, np.int64)   # a copy: kept as the next tick's previous actions
+        if actions.shape != (self.n,):
+            raise ValueError(f"expected {self.n} actions, got shape {actions.shape}")
+        self.ticks += 1
+        previous, self.previous = self.previous, actions
+        fighting = np.flatnonzero(self.in_battle)
+        if fighting.size:
+            # SPACE going down leaves a finished battle
+            a = actions[fighting]
+            leave = (a == self.SPACE) & (previous[fighting] != self.SPACE) & self.battle_over[fighting]
+            if leave.any():
+                self.in_battle[fighting[leave]] = False
+                fighting, a = fighting[~leave], a[~leave]
+            self._fight(fighting, a)
+        self._walk(~self.in_battle, actions)
+
+    def _fight(self, i, actions):
+        # Battle.handle_input: the player attacks on A
+        hit = i[~self.battle_over[i] & ~self.enemy_turn[i] & (actions == self.A)]
+        if hit.size:
+            hp = self.wild_hp[hit] - self.P_DAMAGE
+            ko = hp <= 0
+            hp[ko] = 0
+            self.wild_hp[hit] = hp
+            self.battle_over[hit[ko]] = True
+            self.player_won[hit[ko]] = True
+            self.enemy_turn[hit[~ko]] = True
+        # Battle.update: the enemy answers in the same tick
+        strike = i[~self.battle_over[i] & self.enemy_turn[i]]
+        if strike.size:
+            hp = self.hp[strike] - self.W_DAMAGE
+            ko = hp <= 0
+            hp[ko] = 0
+            self.hp[strike] = hp
+            self.battle_over[strike[ko]] = True   # the turn stays "enemy", as in Battle
+            self.enemy_turn[strike[~ko]] = False
+
+    def _walk(self, walking, actions):
+        # Player.update over whole arrays; walking masks out instances in battles
+        # (take() is much faster than fancy indexing for whole rows)
+        geometry = self.geometry
+        step = self.STEP.take(actions, axis=1)
+        new = self.xy + step
+        t = (new - geometry[0:2]) >> self.SHIFT
+        np.maximum(t, 0, out=t)
+        np.minimum(t, geometry[2:4], out=t)   # off the table: its empty border
+        cells = geometry[5] + t[1] * geometry[4] + t[0]
+        flags = self.flags[cells]
+        moved = walking & self.MOVES.take(actions) & (flags < BLOCKED)
+        step *= moved
+        self.xy += step
+        # Game.check_transitions. Standing still only needs an edge check
+        # after a map change: otherwise the last tick's check still holds.
+        edges = None
+        if self.recheck.any():
+            pending = self.recheck & walking
+            self.recheck &= ~walking
+            edges = np.flatnonzero(pending & ~moved)
+        special = np.flatnonzero(moved & (flags != 0))   # onto grass, a door or an edge
+        if special.size:
+            flags = flags[special]
+            grass = special[(flags & ON_GRASS) != 0]
+            if grass.size:
+                self._encounters(grass)
+            # a door under the step, found or not, skips the edge checks
+            at_door = (flags & ON_DOOR) != 0
+            i = special[at_door]
+            if i.size:
+                self.recheck[i] = True   # the skipped edge check runs next tick, step or not
+                door = self.door_id[np.searchsorted(self.door_cell, cells[i])]
+                target = self.door_target[door]
+                go = target >= 0
+                self._enter(i[go], target[go], self.door_x[door[go]], self.door_y[door[go]])
+            i = special[~at_door & ((flags & ON_EDGE) != 0)]
+            edges = i if edges is None else np.concatenate([edges, i])
+        if edges is not None and edges.size:
+            self._exit(edges)
+
+    def _exit(self, i):
+        # The edge half of Game.check_transitions
+        m, x, y = self.map[i], self.x[i], self.y[i]
+        targets = self.exit_target.take(m, axis=0)
+        side = np.full(i.size, -1, np.int64)
+        # ACMP_SIDES order (up, down, left, right) is also the priority: write it last
+        for s, hit in reversed(list(enumerate((y <= 0, y >= self.map_bottom[m],
+                                               x <= 0, x >= self.map_right[m])))):
+            side[hit & (targets[:, s] != -1)] = s
+        leaving = side >= 0
+        i, m, side = i[leaving], m[leaving], side[leaving]
+        known = self.exit_target[m, side] >= 0
+        i, m, side = i[known], m[known], side[known]
+        self._enter(i, self.exit_target[m, side], self.exit_x[m, side], self.exit_y[m, side])
+
+    def _encounters(self, j):
+        # Map.roll_encounter for steps onto grass: one draw, and a second one
+        # to pick the species (EncounterTable.sample) if a battle starts
+        m = self.map[j]
+        if self.exact:
+            slots = self.slot[j, m]
+            new = np.flatnonzero(slots < 0)
+            if new.size:
+                slots[new] = self.slot[j[new], m[new]] = self._new_slots(j[new], m[new])
+            pos = self.draw_pos[slots]
+            low = pos + 2 > self.draw_end[slots]
+            if low.any():
+                self._refill(slots[low])
+                pos = self.draw_pos[slots]
+            fight = (self.buffer[slots, pos] < self.rate[m]) & (self.enc_size[m] > 0)
+            self.draw_pos[slots] = pos + 1 + fight
+            pick = self.buffer[slots[fight], pos[fight] + 1]
+        else:
+            draws = self._map_draws(m)
+            fight = (draws[0] < self.rate[m]) & (self.enc_size[m] > 0)
+            pick = draws[1][fight]
+        b = j[fight]
+        if not b.size:
+            return
+        mb = m[fight]
+        u = pick * self.enc_size[mb]
+        k = u.astype(np.int64)
+        c = self.enc_off[mb] + k
+        self.wild[b] = np.where(u - k < self.prob[c], self.keep[c], self.alias[c])
+        self.in_battle[b] = True
+        self.battle_over[b] = False
+        self.player_won[b] = False
+        self.enemy_turn[b] = False
+        self.hp[b] = PLAYER_STATS["hp"]
+        self.wild_hp[b] = WILD_STATS["hp"]
+        self.battles[b] += 1
+
+    def _map_draws(self, m):
+        # two draws per instance (roll, species) from the generator of its map
+        first = m[0]
+        if (m == first).all():    # the usual case: everyone on one map
+            return self.generators[first].random((2, m.size))
+        draws = np.empty((2, m.size))
+        for map_id in np.unique(m).tolist():
+            k = np.flatnonzero(m == map_id)
+            draws[:, k] = self.generators[map_id].random((2, k.size))
+        return draws
+
+    def _new_slots(self, instances, map_ids):
+        first = len(self.streams)
+        end = first + len(instances)
+        if end > len(self.draw_pos):
+            grow = max(end, 2 * len(self.draw_pos), 64) - len(self.draw_pos)
+            self.buffer = np.concatenate([self.buffer, np.zeros((grow, BATCH_RNG_BLOCK))])
+            self.draw_pos = np.concatenate([self.draw_pos, np.zeros(grow, np.int64)])
+            self.draw_end = np.concatenate([self.draw_end, np.zeros(grow, np.int64)])
+        self.streams.extend([None, i, m, self.FIRST_FILL] for i, m in zip(instances.tolist(), map_ids.tolist()))
+        return np.arange(first, end)
+
+    def _refill(self, slots):
+        ends = []
+        for slot, pos, end in zip(slots.tolist(), self.draw_pos[slots].tolist(), self.draw_end[slots].tolist()):
+            stream = self.streams[slot]
+            if stream[0] is None:
+                stream[0] = random.Random(f"{self.seed + stream[1]}:{self.map_names[stream[2]]}")
+            rest = end - pos
+            count = min(stream[3], BATCH_RNG_BLOCK - rest)
+            stream[3] = min(stream[3] * 2, BATCH_RNG_BLOCK)
+            row = self.buffer[slot]
+            row[:rest] = row[pos:end]
+            draw = stream[0].random
+            row[rest:rest + count] = [draw() for _ in range(count)]
+            ends.append(rest + count)
+        self.draw_pos[slots] = 0
+        self.draw_end[slots] = ends
+
+    def _enter(self, i, m, x, y):
+        # Game.enter_map
+        if not i.size:
+            return
+        self.map[i] = m
+        self.x[i] = x
+        self.y[i] = y
+        self.map_changes[i] += 1
+        self.recheck[i] = True
+        tables = self._tables(m, x, y)   # (grows table_geometry)
+        self.geometry[:, i] = self.table_geometry.take(tables, axis=1)
+
+    def observations(self):
+        """(n, 6) array of GameEnv observations: map, tile x, tile y, battle, hp, wild_hp."""
+        battle = np.where(self.battle_over, 3 - self.player_won, 1) * self.in_battle
+        return np.stack([self.map, self.x // TILE_SIZE, self.y // TILE_SIZE, battle,
+                         self.hp * self.in_battle, self.wild_hp * self.in_battle], axis=1)
+
+    def fingerprint(self, i):
+        """Game.fingerprint() of instance i."""
+        battle = None
+        if self.in_battle[i]:
+            battle = (self.species[self.wild[i]], int(self.wild_hp[i]), int(self.hp[i]),
+                      "enemy" if self.enemy_turn[i] else "player", bool(self.battle_over[i]))
+        state = (self.map_names[self.map[i]], (int(self.x[i]), int(self.y[i])), bool(self.in_battle[i]),
+                 self.ticks, int(self.battles[i]), int(self.map_changes[i]), battle)
+        return zlib.crc32(repr(state).encode("utf-8"))
+
+def run_batch(n, ticks=BATCH_TICKS, seed=0, start_map=BATCH_START, scalar_instances=BATCH_CHECK_SIZE, exact=False):
+    """Time BatchWorld on n instances against GameEnv stepping some of them one by one."""
+    actions = np.random.default_rng(seed).integers(0, len(ENV_ACTIONS), (ticks, n))
+    batch = BatchWorld(n, seed, start_map, exact=exact)
+    step = batch.step
+    start = time.perf_counter()
+    for row in actions:
+        step(row)
+    batch_seconds = time.perf_counter() - start
+    scalar_instances = min(scalar_instances, n)
+    env = GameEnv(start_map)
+    start = time.perf_counter()
+    for i in range(scalar_instances):
+        env.reset(seed + i)
+        env_step = env.step
+        for action in actions[:, i].tolist():
+            env_step(action)
+    scalar_seconds = (time.perf_counter() - start) * n / scalar_instances
+    return {
+        "instances": n,
+        "ticks": ticks,
+        "batch_seconds": batch_seconds,
+        "batch_steps_per_second": n * ticks / batch_seconds,
+        "scalar_steps_per_second": n * ticks / scalar_seconds,
+        "speedup": scalar_seconds / batch_seconds,
+        "battles": int(batch.battles.sum()),
+        "map_changes": int(batch.map_changes.sum()),
+    }
 
 # ==================== MAIN GAME LOOP ====================
-def main():
-    # Show main menu first
-    main_menu()
+def seed_world(seed):
+    """Reseed every map's encounter stream (including ones not loaded yet)."""
+    maps.reseed(seed)
+
+def main(app=None, dirty_rects=False, render_fps=FPS, profile=False, seed=None, record=None, replay=None,
+         stream=False):
+    # dirty_rects: push only the changed regions to the display instead of
+    # flipping the whole frame (helps software-rendered SDL targets).
+    # render_fps caps drawing only (0 = uncapped); logic always runs at LOGIC_HZ.
+    # profile: start with the frame profiler overlay on (PROFILE_KEY toggles it).
+    # record: path to save the session's per-tick input and seed to (.acrp).
+    # replay: a Replay to play instead of the keyboard; the menu is skipped and
+    # the game quits when the recording ends.
+    # stream: prefetch the maps around the player (MapStreamer) and scroll
+    # across edge exits instead of cutting to the next map.
+    if app is None:
+        app = App().start()
+    screen = app.screen
+    dirty = DirtyTracker(dirty_rects, app.presenter)
+    profiler = FrameProfiler(enabled=profile)
+    lap = profiler.lap_fn
 
-    current_map = maps["Pallet Town"]
-    player = Player(300, 200)
-    battle = None
+    if replay is None:
+        # Show main menu first
+        main_menu(app, dirty)
+        replayed = None
+    else:
+        seed = replay.seed
+        replayed = iter(replay)
+    if seed is None and record:
+        seed = random.randrange(2 ** 63)  # a replay needs the seed spelled out
+    recorder = InputRecorder(seed) if record else None
+
+    game = Game(seed=seed)
+    player = game.player
+    shown = None                      # (map, battle) on screen last frame
+    shown_player = player.rect.copy()
+    streamer = MapStreamer() if stream else None
+    scroll = None                     # (map scrolled away from, its camera offset, exit side, start time)
+    camera = Camera(screen.get_size())
+    shown_offset = camera.offset
+    sprites = SpriteBatch(get_sprites(), layers=("sprites",))  # drawn over the map, one blits() a frame
+    presenter = app.presenter
+    effect = None                     # running palette effect, see palette_effect()
+
+    # Fixed timestep: real time accumulates and is consumed in LOGIC_HZ ticks,
+    # so game speed no longer depends on the frame rate. A slow frame runs
+    # several ticks before the next render instead of slowing the game down.
+    step = 1.0 / LOGIC_HZ
+    accumulator = 0.0
+    previous = time.perf_counter()
+    pressed = []                      # key presses not yet seen by a tick
 
     running = True
     while running:
-        clock.tick(FPS)
+        app.clock.tick(render_fps)
+        lap("wait")
+        now = time.perf_counter()
+        accumulator += now - previous
+        previous = now
         keys = pygame.key.get_pressed()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and battle and battle.battle_over:
-                    player.in_battle = False
-                    battle = None
-
-        if player.in_battle and battle is None:
-            # Start a new battle if just entered battle mode
-            battle = Battle(player, random.choice(current_map.wild_pokemon))
+                if event.key == PROFILE_KEY:
+                    profiler.toggle()
+                    lap = profiler.lap_fn
+                    dirty.invalidate()    # erase or show the overlay everywhere
+                    continue
+                pressed.append(event.key)
+        lap("events")
 
-        if battle:
-            battle.handle_input(keys)
-            battle.update()
-        else:
-            # Overworld movement
-            new_battle = player.update(keys, current_map)
-            if new_battle:
-                battle = new_battle
-
-            # Check door transitions
-            door_result = current_map.get_door(player.rect)
-            if door_result:
-                target_map, spawn_x, spawn_y = door_result
-                if target_map in maps:
-                    current_map = maps[target_map]
-                    player.set_position(spawn_x, spawn_y)  # fixed: update both rect and x,y
-
-            # Edge transitions
+        ticks = 0
+        while accumulator >= step and ticks < MAX_FRAME_TICKS:
+            if replayed is not None:
+                keys, pressed = next(replayed, (None, None))
+                if keys is None:
+                    running = False
+                    break
+            if recorder is not None:
+                recorder.record(keys, pressed)
+            if game.update(keys, pressed):
+                lap("update")
+                game.check_transitions()
+                lap("transitions")
             else:
-                if player.rect.top <= 0 and "up" in current_map.exits:
-                    target = current_map.exits["up"]
-                    current_map = maps[target[0]]
-                    player.set_position(target[1], target[2])  # fixed
-                elif player.rect.bottom >= SCREEN_HEIGHT and "down" in current_map.exits:
-                    target = current_map.exits["down"]
-                    current_map = maps[target[0]]
-                    player.set_position(target[1], target[2])  # fixed
-                elif player.rect.left <= 0 and "left" in current_map.exits:
-                    target = current_map.exits["left"]
-                    current_map = maps[target[0]]
-                    player.set_position(target[1], target[2])  # fixed
-                elif player.rect.right >= SCREEN_WIDTH and "right" in current_map.exits:
-                    target = current_map.exits["right"]
-                    current_map = maps[target[0]]
-                    player.set_position(target[1], target[2])  # fixed
-
-        # Drawing
-        screen.fill(BLACK)
-        current_map.draw(screen)
-        player.draw(screen)
+                lap("update")
+            pressed = []
+            accumulator -= step
+            ticks += 1
+        if ticks == MAX_FRAME_TICKS:
+            accumulator %= step       # too far behind: drop the backlog
+        alpha = accumulator / step
+        current_map, battle = game.current_map, game.battle
+        if streamer is not None:
+            if shown is not None and current_map is not shown[0] and game.exit_side:
+                scroll = (shown[0], shown_offset, game.exit_side, now)
+            streamer.focus(game.map_name)
+            streamer.poll()
+
+        if presenter is not None and presenter.indexed:
+            # Palette effects are a set_palette() per frame, not a redraw
+            if battle is not None and (shown is None or battle is not shown[1]):
+                effect = ("flash", now)
+            elif shown is not None and current_map is not shown[0] and scroll is None:
+                effect = ("fade", now)
+            if effect is not None:
+                args = palette_effect(effect, now)
+                presenter.set_palette(**(args or {}))
+                effect = effect if args else None
+                dirty.invalidate()    # every pixel's colour may have changed
+
+        # Drawing (the map background covers the whole screen)
+        if (current_map, battle) != shown:
+            dirty.invalidate()        # new map, or the battle overlay came/went
+            shown = (current_map, battle)
+        player_alpha = 1.0 if battle else alpha
+        cam_x, cam_y = camera.follow(player.position(player_alpha), current_map)
+        if scroll is not None and battle is None:
+            # Old map slides out as the new one slides in from the exit side
+            old_map, (old_x, old_y), side, start = scroll
+            progress = min((now - start) / SCROLL_TIME, 1.0)
+            dx, dy = SCROLL_DIRECTIONS[side]
+            width, height = screen.get_size()
+            shift_x, shift_y = round(dx * width * progress), round(dy * height * progress)
+            offset = (cam_x + shift_x - dx * width, cam_y + shift_y - dy * height)
+            old_map.draw(screen, (old_x + shift_x, old_y + shift_y))
+            current_map.draw(screen, offset, clear=False)
+            player.draw(screen, alpha, offset, batch=sprites)
+            sprites.draw(screen)
+            dirty.invalidate()
+            if progress >= 1.0:
+                scroll = None
+        elif battle is None or battle.backdrop is None:
+            scroll = None
+            current_map.draw(screen, (cam_x, cam_y))
+            player.draw(screen, player_alpha, (cam_x, cam_y), batch=sprites)
+            sprites.draw(screen)
+            if battle:
+                battle.capture_backdrop(screen)
+        if (cam_x, cam_y) != shown_offset:
+            dirty.invalidate()        # the camera moved: everything on screen did
+            shown_offset = (cam_x, cam_y)
+        if player.draw_rect != shown_player:
+            dirty.add(shown_player)
+            dirty.add(player.draw_rect)
+            shown_player = player.draw_rect
+        lap("map draw")
         if battle:
+            old_rects, old_key = battle.text_rects, battle.text_key
             battle.draw(screen)
-        pygame.display.flip()
+            if battle.text_key != old_key:
+                dirty.add_all(old_rects)
+                dirty.add_all(battle.text_rects)
+        lap("battle draw")
+        if profiler.enabled:
+            dirty.add(profiler.draw(screen))
+        dirty.present()
+        lap("present")
+        if profiler.enabled:
+            profiler.end_frame()
 
-    pygame.quit()
+    if recorder is not None:
+        recorder.save(record, game.fingerprint())
+    if streamer is not None:
+        streamer.close()
+    app.stop()
+    if replay is not None and game.fingerprint() != replay.fingerprint:
+        sys.exit("replay diverged from the recording")
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Pokémon Red (GameBoy Edition)")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="update only changed screen regions instead of flipping every frame")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help="render frame cap, 0 for uncapped (logic always runs at %d Hz)" % LOGIC_HZ)
+    parser.add_argument("--scale", type=int,
+                        help="integer window scale of the framebuffer (2 = 1200x800, 4 = 2400x1600)")
+    parser.add_argument("--gameboy", type=int, nargs="?", const=1, metavar="K",
+                        help="draw into a 160Kx144K framebuffer (GameBoy screen x K, text scales with it); "
+                             "bare --gameboy is the 160x144 preset shown at %dx" % GB_WINDOW_SCALE)
+    parser.add_argument("--scanlines", action="store_true", help="darken every scaled pixel row's last line")
+    parser.add_argument("--indexed", action="store_true",
+                        help="8-bit palettized rendering for palette fades at doors, the battle flash and "
+                             "--gb-palette themes (a look, not faster: frames are converted to 32-bit)")
+    parser.add_argument("--gb-palette", choices=sorted(GB_PALETTES),
+                        help="alternative GameBoy palette (implies --indexed)")
+    parser.add_argument("--stream", action="store_true",
+                        help="prefetch neighbouring maps in the background and scroll across edge exits")
+    parser.add_argument("--profile", action="store_true",
+                        help="start with the frame profiler overlay shown (F3 toggles it)")
+    parser.add_argument("--headless", action="store_true",
+                        help="simulate without a window or frame cap and report ticks per second")
+    parser.add_argument("--ticks", type=int, default=100000,
+                        help="tick budget for --headless (default: %(default)s)")
+    parser.add_argument("--script", metavar="FILE",
+                        help="key script for --headless (default: seeded random walk)")
+    parser.add_argument("--seed", type=int, help="RNG seed (default: 0 for --headless / --env-steps / --batch / --simulate-battles, "
+                                                  "random for the game)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="save the session's per-tick input and RNG seed to FILE (.acrp)")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back a --record file instead of reading the keyboard (with --headless too)")
+    parser.add_argument("--convert-maps", metavar="DIR",
+                        help="write every map in maps/ to DIR in the binary .acmp format")
+    parser.add_argument("--map-dir", metavar="DIR", help="load maps from DIR instead of maps/")
+    parser.add_argument("--route", nargs=2, metavar=("FROM", "TO"),
+                        help="print the shortest chain of exits and doors between two maps")
+    parser.add_argument("--env-steps", type=int, metavar="N",
+                        help="step the agent environment N times with random actions and report steps per second")
+    parser.add_argument("--batch", type=int, metavar="N",
+                        help="step N world instances at once with NumPy and report the speedup over GameEnv")
+    parser.add_argument("--simulate-battles", type=int, metavar="N",
+                        help="run N seeded Monte Carlo battles with NumPy and print the summary")
+    args = parser.parse_args()
+    if args.map_dir:
+        maps = MapRegistry(args.map_dir)
+    if args.convert_maps:
+        converted = convert_maps(maps, args.convert_maps)
+        print(f"wrote {len(converted)} maps to {args.convert_maps}")
+        sys.exit(0)
+    if args.route:
+        try:
+            path = world.route(*args.route)
+        except KeyError as exc:
+            sys.exit(f"unknown map {exc}")
+        if path is None:
+            sys.exit(f"no route from {args.route[0]} to {args.route[1]}")
+        for t in path:
+            via = t.via if t.kind == "exit" else "at %d,%d" % t.via[:2]
+            print(f"{t.source} -> {t.target} ({t.kind} {via}, spawn {t.x},{t.y})")
+        print(f"{len(path)} transition(s)")
+        sys.exit(0)
+    replay = Replay.from_file(args.replay) if args.replay else None
+    if args.simulate_battles:
+        seed = args.seed or 0
+        start = time.perf_counter()
+        result = simulate_battles(*sample_battle_stats(args.simulate_battles, seed))
+        elapsed = time.perf_counter() - start
+        turns = result["turns_hist"]
+        print(f"{result['n']:,} battles in {elapsed:.3f}s: win rate {result['win_rate']:.4f} "
+              f"({result['wins']:,} won, {result['losses']:,} lost, {result['undecided']:,} undecided)")
+        print("turns to KO:", {t: int(c) for t, c in enumerate(turns) if c})
+        sys.exit(0)
+    if args.env_steps:
+        stats = run_env(args.env_steps, args.seed or 0)
+        print(f"{stats['steps']} steps in {stats['seconds']:.3f}s ({stats['steps_per_second']:,.0f} steps/s), "
+              f"{stats['episodes']} episodes, best return {stats['best_return']:.2f}")
+        sys.exit(0)
+    if args.batch:
+        seed = args.seed or 0
+        stats = run_batch(args.batch, seed=seed)
+        print(f"{stats['instances']} instances x {stats['ticks']} ticks in {stats['batch_seconds']:.3f}s "
+              f"({stats['batch_steps_per_second']:,.0f} steps/s vs {stats['scalar_steps_per_second']:,.0f} scalar, "
+              f"{stats['speedup']:.0f}x), {stats['battles']} battles, {stats['map_changes']} map changes")
+        exact = run_batch(args.batch, seed=seed, exact=True)
+        print(f"  exact=True (the scalar game's random.Random streams): {exact['speedup']:.0f}x, "
+              f"{exact['battles']} battles")
+        sys.exit(0)
+    if args.headless:
+        if replay is not None:
+            ticks, inputs, seed = replay.ticks, replay, replay.seed
+        else:
+            ticks, seed = args.ticks, args.seed or 0
+            inputs = ScriptedInput.from_file(args.script) if args.script else None
+        recorder = InputRecorder(seed) if args.record else None
+        stats = run_headless(ticks, inputs, seed, recorder)
+        print(f"{stats['ticks']} ticks in {stats['seconds']:.3f}s "
+              f"({stats['ticks_per_second']:,.0f} ticks/s), {stats['battles']} battles, "
+              f"{stats['map_changes']} map changes, ended on {stats['final_map']}")
+        if recorder is not None:
+            recorder.save(args.record, stats["fingerprint"])
+        if replay is not None:
+            matched = stats["fingerprint"] == replay.fingerprint
+            print("replay:", "bit-exact" if matched else "DIVERGED from the recording")
+            sys.exit(0 if matched else 1)
+        sys.exit(0)
+    frame = (GB_SCREEN[0] * args.gameboy, GB_SCREEN[1] * args.gameboy) if args.gameboy else (SCREEN_WIDTH, SCREEN_HEIGHT)
+    if args.scale is None:
+        args.scale = GB_WINDOW_SCALE if args.gameboy == 1 else 1
+    app = App(frame, scale=args.scale, scanlines=args.scanlines,
+              indexed=args.indexed or bool(args.gb_palette), theme=args.gb_palette or "green").start()
+    main(app, dirty_rects=args.dirty_rects, render_fps=args.fps, profile=args.profile,
+         seed=args.seed, record=args.record, replay=replay, stream=args.stream)
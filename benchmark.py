@@ -0,0 +1,382 @@
+"""Benchmarks for the GameBoy edition (#####acred4k.py).
+
+Runs headless (SDL dummy video driver), so it works on a plain Linux box:
+
+    python benchmark.py run [--quick] [--filter TEXT] [--replay FILE.acrp] [--json FILE]
+    python benchmark.py compare BASE.json NEW.json [--threshold 0.10]
+    python benchmark.py startup [--runs N] [--json FILE]
+
+`run` times the engine hot paths against every shipped map and against
+synthetic maps with 10^3..10^5 walls and prints ns per call; `compare`
+flags cases that got slower than the threshold between two result files
+(e.g. one written on each of two commits) and exits 1 if any did.
+`--replay` adds a headless playback of a recorded session (the game's
+`--record` option), so long identical sessions can be timed across versions.
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GAME_PATH = os.path.join(HERE, "#####acred4k.py")
+SYNTHETIC_SIZES = (1000, 10000, 100000)
+BATCH_INSTANCES = 4096
+
+def load_game():
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    spec = importlib.util.spec_from_file_location("acred4k", GAME_PATH)
+    game = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(game)
+    return game
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ==================== FIXTURES ====================
+def synthetic_map(game, n_walls, seed=0, size=None):
+    """A map (screen-sized by default) with n_walls random walls (a mix of
+    tile-aligned 16x16 blocks and odd-sized rects), plus grass and doors at a
+    tenth of that."""
+    pygame = game.pygame
+    rng = random.Random(seed)
+    width, height = size or (game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
+
+    def rect(aligned):
+        if aligned:
+            return pygame.Rect(rng.randrange(0, width, 16), rng.randrange(0, height, 16), 16, 16)
+        return pygame.Rect(rng.randrange(width), rng.randrange(height), rng.randint(2, 40), rng.randint(2, 40))
+
+    walls = [rect(i % 2 == 0) for i in range(n_walls)]
+    grass = [rect(True) for _ in range(n_walls // 10)]
+    doors = [(rect(False), "Pallet Town", 300, 200) for _ in range(n_walls // 10)]
+    return game.Map(f"synthetic-{n_walls}-{width}x{height}" if size else f"synthetic-{n_walls}", width, height, walls, grass,
+                    ["Rattata", "Pidgey"], {}, doors, seed=seed)
+
+def fixture_maps(game, quick=False):
+    maps = [(name, game.maps[name]) for name in game.maps]
+    sizes = SYNTHETIC_SIZES[:2] if quick else SYNTHETIC_SIZES
+    maps += [(f"synthetic-{n}", synthetic_map(game, n)) for n in sizes]
+    return maps
+
+def query_rects(game, count=256, seed=1):
+    rng = random.Random(seed)
+    return [game.pygame.Rect(rng.randrange(-16, game.SCREEN_WIDTH), rng.randrange(-16, game.SCREEN_HEIGHT), 16, 16)
+            for _ in range(count)]
+
+# ==================== TIMING ====================
+def measure(fn, number, repeat=5):
+    """Best-of-repeat time per call of fn() in nanoseconds (fn runs number times per repeat)."""
+    fn()  # warm caches (map backgrounds, text surfaces)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        elapsed = (time.perf_counter_ns() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def map_cases(game, app, game_map):
+    rects = query_rects(game)
+    keys = [game.KeyState((k,)) for k in (game.pygame.K_LEFT, game.pygame.K_UP,
+                                           game.pygame.K_RIGHT, game.pygame.K_DOWN)]
+    player = game.Player(300, 200)
+    state = {"i": 0}
+
+    def check_collision():
+        for r in rects:
+            game_map.check_collision(r)
+
+    def is_grass():
+        for r in rects:
+            game_map.is_grass(r)
+
+    def get_door():
+        for r in rects:
+            game_map.get_door(r)
+
+    def player_update():
+        i = state["i"] = state["i"] + 1
+        player.in_battle = False
+        player.update(keys[(i >> 3) & 3], game_map)
+
+    per = len(rects)
+    return [
+        ("Map.check_collision", check_collision, 20, per),
+        ("Map.is_grass", is_grass, 20, per),
+        ("Map.get_door", get_door, 20, per),
+        ("Map.draw", lambda: game_map.draw(app.screen), 200, 1),
+        ("Player.update", player_update, 2000, 1),
+    ]
+
+CAMERA_SCALES = (1, 4, 16, 64)   # map area in screens, same wall density
+
+def camera_cases(game, app, quick=False):
+    """Map.draw through a Camera on ever larger maps: the cost should not grow."""
+    cases = []
+    for scale in CAMERA_SCALES[:3] if quick else CAMERA_SCALES:
+        side = int(scale ** 0.5)
+        size = (game.SCREEN_WIDTH * side, game.SCREEN_HEIGHT * side)
+        game_map = synthetic_map(game, 1000 * scale, size=size)
+        camera = game.Camera(app.screen.get_size())
+        # Circle the camera around the middle of the map, ~40px per frame
+        radius = game.SCREEN_HEIGHT
+        path = [(size[0] // 2 + round(radius * math.cos(i * math.tau / 64)),
+                 size[1] // 2 + round(radius * math.sin(i * math.tau / 64))) for i in range(64)]
+        state = {"i": 0}
+
+        def draw(game_map=game_map, camera=camera, path=path, state=state):
+            state["i"] = (state["i"] + 1) % len(path)
+            game_map.draw(app.screen, camera.follow(path[state["i"]], game_map))
+
+        cases.append((f"Map.draw camera[{size[0]}x{size[1]}]", draw, 200))
+    return cases
+
+SPRITE_COUNTS = (1000, 10000)
+
+def sprite_cases(game, app):
+    """N player-sized sprites per frame: two draw.rect primitives each (the old
+    Player.draw) against one SpriteBatch, i.e. a single Surface.blits() call."""
+    pygame = game.pygame
+    screen = app.screen
+    atlas = game.get_sprites()
+    cases = []
+    for count in SPRITE_COUNTS:
+        rng = random.Random(count)
+        spots = [(rng.randrange(game.SCREEN_WIDTH - 16), rng.randrange(game.SCREEN_HEIGHT - 16))
+                 for _ in range(count)]
+
+        def primitives(spots=spots):
+            for x, y in spots:
+                pygame.draw.rect(screen, game.RED, (x + 4, y, 8, 4))
+                pygame.draw.rect(screen, game.WHITE, (x + 2, y + 4, 12, 12))
+
+        def atlas_blits(spots=spots, batch=game.SpriteBatch(atlas)):
+            batch.add_many("sprites", "player", spots)
+            batch.draw(screen)
+
+        cases.append((f"sprites primitive[{count}]", primitives, max(20000 // count, 2)))
+        cases.append((f"sprites atlas blits[{count}]", atlas_blits, max(20000 // count, 2)))
+    return cases
+
+PRESENT_SCALES = ((2, False, False), (4, False, False), (4, True, False), (4, False, True))
+
+def present_cases(game, app):
+    """Upscaling the framebuffer into 2x/4x windows (offscreen, so no real
+    display is needed); drawing into the framebuffer costs the same at any scale."""
+    pygame = game.pygame
+    size = app.screen.get_size()
+    cases = []
+    for scale, scanlines, indexed in PRESENT_SCALES:
+        window = pygame.Surface((size[0] * scale, size[1] * scale), 0, app.screen)
+        presenter = game.Presenter(window, size, scale, scanlines, indexed)
+        presenter.frame.blit(app.screen, (0, 0))
+        name = f"Presenter.compose x{scale}{' scanlines' if scanlines else ''}{' indexed' if indexed else ''}"
+        cases.append((name, presenter.compose, 50))
+        if indexed:
+            # one frame of a door fade: a precomputed palette, swapped in by compose()
+            cases.append((f"Presenter.compose x{scale} indexed fade",
+                          lambda p=presenter: (p.set_palette(fade=0.5), p.compose()), 50))
+    return cases
+
+def screen_cases(game, app):
+    pygame = game.pygame
+    screen = app.screen
+    battle = game.Battle(game.Player(300, 200), "Pidgey")
+    battle_map = game.maps["Route 1"]
+    battle_map.draw(screen)
+    battle.capture_backdrop(screen)
+    menu = {"selected": 0}
+
+    def menu_frame():
+        menu["selected"] ^= 1
+        game.draw_menu(screen, menu["selected"])
+
+    world = game.Game(seed=0)
+    walk = iter(game.RandomInput(0))
+
+    def overworld_frame():
+        keys, pressed = next(walk)
+        world.tick(keys, pressed)
+        world.current_map.draw(screen)
+        world.player.draw(screen)
+        if world.battle:
+            world.battle.draw(screen)
+        pygame.display.flip()
+
+    return [
+        ("Battle.draw", lambda: battle.draw(screen), 200),
+        ("main_menu frame", menu_frame, 200),
+        ("overworld frame", overworld_frame, 200),
+    ]
+
+def env_cases(game):
+    """One agent-environment step (a logic tick plus observation and reward) on a seeded random walk,
+    and one batched world step over BATCH_INSTANCES instances."""
+    env = game.GameEnv(game.BATCH_START)   # a map with grass, so encounters are timed too
+    env.reset(0)
+    rng = random.Random(0)
+    count = len(game.ENV_ACTIONS)
+
+    def step():
+        if env.step(rng.randrange(count))[3]:
+            env.reset()
+
+    batch = game.BatchWorld(BATCH_INSTANCES, start_map=game.BATCH_START)
+    rows = itertools.cycle(game.np.random.default_rng(0).integers(0, count, (256, BATCH_INSTANCES)))
+
+    def batch_step():
+        batch.step(next(rows))
+
+    return [("GameEnv.step", step, 2000), (f"BatchWorld.step[{BATCH_INSTANCES}]", batch_step, 100)]
+
+def replay_case(game, path):
+    """Headless playback of a recorded session, timed per tick."""
+    replay = game.Replay.from_file(path)
+
+    def session():
+        stats = game.run_headless(replay.ticks, replay, replay.seed)
+        if stats["fingerprint"] != replay.fingerprint:
+            raise SystemExit(f"{path}: replay diverged from the recording")
+
+    return (f"replay[{os.path.basename(path)}]", session, replay.ticks)
+
+def run_suite(quick=False, name_filter=None, repeat=5, replay=None):
+    game = load_game()
+    app = game.App(headless=True).start()
+    results = {}
+
+    def record(case, fn, number, per=1):
+        if name_filter and name_filter not in case:
+            return
+        ns = measure(fn, number, repeat) / per
+        results[case] = {"ns_per_call": ns}
+        print(f"{case:<48} {ns:>14,.0f} ns")
+
+    for map_name, game_map in fixture_maps(game, quick):
+        for case, fn, number, per in map_cases(game, app, game_map):
+            record(f"{case}[{map_name}]", fn, max(number // 10, 1) if quick else number, per)
+    cases = camera_cases(game, app, quick) + sprite_cases(game, app) + present_cases(game, app) + screen_cases(game, app) + env_cases(game)
+    for case, fn, number in cases:
+        record(case, fn, max(number // 10, 1) if quick else number)
+    if replay:
+        case, fn, per = replay_case(game, replay)
+        record(case, fn, 1, per)
+    app.stop()
+    return {
+        "meta": {"commit": git_commit(), "python": platform.python_version(),
+                 "pygame": game.pygame.version.ver, "machine": platform.machine(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+# ==================== COMPARE ====================
+def compare(base, new, threshold=0.10):
+    """Print old/new per case; return the cases slower by more than threshold."""
+    regressions = []
+    print(f"{'case':<48} {'base ns':>12} {'new ns':>12} {'change':>8}")
+    for case, old in sorted(base["results"].items()):
+        if case not in new["results"]:
+            continue
+        before, after = old["ns_per_call"], new["results"][case]["ns_per_call"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print(f"{case:<48} {before:>12,.0f} {after:>12,.0f} {change:>+8.1%}{flag}")
+    return regressions
+
+# ==================== STARTUP ====================
+# Runs in a fresh interpreter per sample so every import is a cold one.
+STARTUP_PROBE = r"""
+import time
+t0 = time.perf_counter()
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location("acred4k", sys.argv[1])
+game = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(game)
+t1 = time.perf_counter()
+app = game.App(headless=True).start()
+world = game.Game()
+world.current_map.draw(app.screen)
+world.player.draw(app.screen)
+game.pygame.display.flip()
+t2 = time.perf_counter()
+app.stop()
+print(json.dumps({"import_ms": (t1 - t0) * 1e3, "first_frame_ms": (t2 - t1) * 1e3,
+                  "total_ms": (t2 - t0) * 1e3}))
+"""
+
+def bench_startup(runs=10):
+    """Import-to-first-frame time, measured in fresh interpreters."""
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, GAME_PATH], env=env,
+                             check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: {"median": statistics.median(s[key] for s in samples),
+                  "min": min(s[key] for s in samples)}
+            for key in samples[0]}
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="time the engine hot paths")
+    run.add_argument("--quick", action="store_true", help="fewer iterations, skip the 10^5-wall map")
+    run.add_argument("--filter", metavar="TEXT", help="only cases whose name contains TEXT")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--replay", metavar="FILE", help="also time a headless playback of a recorded session")
+    run.add_argument("--json", metavar="FILE", help="write the results as JSON")
+    cmp_ = sub.add_parser("compare", help="flag regressions between two `run --json` files")
+    cmp_.add_argument("base")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.10,
+                      help="relative slowdown that counts as a regression (default: %(default)s)")
+    startup = sub.add_parser("startup", help="measure import-to-first-frame time")
+    startup.add_argument("--runs", type=int, default=10)
+    startup.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.quick, args.filter, args.repeat, args.replay)
+        if args.json:
+            write_json(args.json, results)
+    elif args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+    elif args.command == "startup":
+        results = {"startup": bench_startup(args.runs)}
+        for key, value in results["startup"].items():
+            print(f"{key:>16}: median {value['median']:8.2f} ms   min {value['min']:8.2f} ms")
+        if args.json:
+            write_json(args.json, results)
+
+if __name__ == "__main__":
+    main()
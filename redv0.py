@@ -1,16 +1,16 @@
 import pygame
 import random
 import sys
+from collections import OrderedDict
 from enum import Enum
 
-# Initialize Pygame
-pygame.init()
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 400
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Pokémon Red (Simplified)")
-clock = pygame.time.Clock()
+CAPTION = "Pokémon Red (Simplified)"
 FPS = 30
+TILE_SIZE = 16  # collision grid cell size (one player step)
+LINEAR_SCAN_WALLS = 64  # maps with at most this many walls check them with one Rect.collidelist:
+                        # cheaper than walking the collision grid's tiles
 
 # Colors
 WHITE = (255, 255, 255)
@@ -91,11 +91,69 @@ class Map:
         self.grass = grass  # list of pygame.Rect where grass tiles are
         self.wild_pokemon = wild_pokemon  # list of possible encounters
         self.exits = exits  # dict: direction -> (new_map_name, new_player_x, new_player_y)
+        self._build_collision_grid()
+
+    def _build_collision_grid(self):
+        # Bake the walls into a per-tile bitmap over the 16px grid. Tiles a wall
+        # covers completely are marked solid; tiles a wall only clips (e.g. the
+        # 50x50 houses) remember the rects touching them so those still collide
+        # exactly. Wall parts hanging outside the grid are kept in `outside`.
+        self.cols = -(-self.width // TILE_SIZE)
+        self.rows = -(-self.height // TILE_SIZE)
+        self.bounds = pygame.Rect(0, 0, self.cols * TILE_SIZE, self.rows * TILE_SIZE)
+        self.solid = bytearray(self.cols * self.rows)  # 1 = tile fully blocked
+        self.partial = {}                              # tile index -> [wall rects]
+        self.outside = []
+        for wall in self.walls:
+            self._bake_wall(wall)
+
+    def _tile_span(self, rect):
+        """Return the (col0, row0, col1, row1) tiles under rect, clipped to the grid."""
+        col0 = max(rect.left // TILE_SIZE, 0)
+        row0 = max(rect.top // TILE_SIZE, 0)
+        col1 = min((rect.right - 1) // TILE_SIZE, self.cols - 1)
+        row1 = min((rect.bottom - 1) // TILE_SIZE, self.rows - 1)
+        return col0, row0, col1, row1
+
+    def _bake_wall(self, wall):
+        if wall.width <= 0 or wall.height <= 0:
+            return
+        if not self.bounds.contains(wall):
+            self.outside.append(wall)
+        col0, row0, col1, row1 = self._tile_span(wall)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = row * self.cols + col
+                if self.solid[index]:
+                    continue
+                tile = pygame.Rect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                if wall.contains(tile):
+                    self.solid[index] = 1
+                    self.partial.pop(index, None)
+                else:
+                    self.partial.setdefault(index, []).append(wall)
 
     def check_collision(self, rect):
-        for wall in self.walls:
-            if wall.colliderect(rect):
-                return True
+        if len(self.walls) <= LINEAR_SCAN_WALLS:
+            return rect.collidelist(self.walls) != -1
+        # O(tiles touched) instead of O(walls); the span is _tile_span() inlined
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+        solid = self.solid
+        partial = self.partial
+        cols = self.cols
+        col0 = max(rect.left // TILE_SIZE, 0)
+        col1 = min((rect.right - 1) // TILE_SIZE, cols - 1)
+        for row in range(max(rect.top // TILE_SIZE, 0), min((rect.bottom - 1) // TILE_SIZE, self.rows - 1) + 1):
+            base = row * cols
+            for index in range(base + col0, base + col1 + 1):
+                if solid[index]:
+                    return True
+                walls = partial.get(index)
+                if walls and rect.collidelist(walls) != -1:
+                    return True
+        if self.outside and not self.bounds.contains(rect):
+            return rect.collidelist(self.outside) != -1
         return False
 
     def is_grass(self, rect):
@@ -121,7 +179,47 @@ class Map:
         for g in self.grass:
             pygame.draw.rect(surface, DARK_GREEN, g)
 
+# ==================== Text Cache ====================
+TEXT_CACHE_SIZE = 32  # rendered lines kept; a battle shows at most five
+_fonts = {}  # point size -> pygame.font.Font
+_text_surfaces = OrderedDict()  # (size, text, color) -> rendered Surface, oldest first
+
+def get_font(size):
+    """Return the shared default Font for size, loading it on first use."""
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(None, size)
+    return font
+
+def render_text(text, size, color):
+    """Rendered text, re-rendered only when the line was not drawn recently."""
+    key = (size, text, color)
+    surf = _text_surfaces.get(key)
+    if surf is not None:
+        _text_surfaces.move_to_end(key)
+        return surf
+    surf = _text_surfaces[key] = get_font(size).render(text, True, color)
+    if len(_text_surfaces) > TEXT_CACHE_SIZE:
+        _text_surfaces.popitem(last=False)
+    return surf
+
 # ==================== Battle Class ====================
+BATTLE_DIM_ALPHA = 180
+_dim_overlays = {}  # screen size -> pre-built battle overlay
+
+def get_dim_overlay(size):
+    """Return the translucent battle overlay for a screen size, built once per size."""
+    overlay = _dim_overlays.get(size)
+    if overlay is None:
+        _dim_overlays.clear()  # the screen was resized; drop the old one
+        overlay = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            overlay = overlay.convert()
+        overlay.set_alpha(BATTLE_DIM_ALPHA)
+        overlay.fill(BLACK)
+        _dim_overlays[size] = overlay
+    return overlay
+
 class Battle:
     def __init__(self, player, wild_pokemon):
         self.player = player
@@ -176,33 +274,29 @@ class Battle:
 
     def draw(self, surface):
         # Dark overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.set_alpha(180)
-        overlay.fill(BLACK)
-        surface.blit(overlay, (0, 0))
+        surface.blit(get_dim_overlay(surface.get_size()), (0, 0))
 
         # Battle UI
-        font = pygame.font.Font(None, 24)
         # Player Pokémon info
         player_text = f"{self.player_pokemon['name']} HP: {self.player_pokemon['hp']}/{self.player_pokemon['max_hp']}"
-        player_surf = font.render(player_text, True, WHITE)
+        player_surf = render_text(player_text, 24, WHITE)
         surface.blit(player_surf, (50, 250))
 
         # Enemy Pokémon info
         enemy_text = f"Wild {self.wild_pokemon['name']} HP: {self.wild_pokemon['hp']}/{self.wild_pokemon['max_hp']}"
-        enemy_surf = font.render(enemy_text, True, WHITE)
+        enemy_surf = render_text(enemy_text, 24, WHITE)
         surface.blit(enemy_surf, (350, 50))
 
         # Message
-        msg_surf = font.render(self.message, True, WHITE)
+        msg_surf = render_text(self.message, 24, WHITE)
         surface.blit(msg_surf, (50, 300))
 
         # Instructions
-        inst_surf = font.render("Press A to attack", True, WHITE)
+        inst_surf = render_text("Press A to attack", 24, WHITE)
         surface.blit(inst_surf, (50, 350))
 
         if self.battle_over:
-            over_surf = font.render("Battle over! Press SPACE to continue.", True, WHITE)
+            over_surf = render_text("Battle over! Press SPACE to continue.", 24, WHITE)
             surface.blit(over_surf, (150, 200))
 
 # ==================== Define Maps ====================
@@ -278,6 +372,14 @@ maps = {
 
 # ==================== Main Game Loop ====================
 def main():
+    # SDL starts here, not at import: Map, Player and Battle can be imported
+    # without opening a window. Only display and font are needed (no mixer).
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(CAPTION)
+    clock = pygame.time.Clock()
+
     current_map = maps["Pallet Town"]
     player = Player(300, 200)
     battle = None
@@ -0,0 +1,30 @@
+"""Shared fixtures: the game module, loaded once under SDL's dummy video driver."""
+import importlib.util
+import json
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAME_PATH = os.path.join(ROOT, "#####acred4k.py")
+
+with open(os.path.join(ROOT, "maps", "index.json"), encoding="utf-8") as f:
+    MAP_NAMES = list(json.load(f))
+
+
+@pytest.fixture(scope="session")
+def game():
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    spec = importlib.util.spec_from_file_location("acred4k", GAME_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def numpy_game(game):
+    """The game module, for tests of code paths that need NumPy."""
+    if game.np is None:
+        pytest.skip("needs NumPy")
+    return game
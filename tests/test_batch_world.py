@@ -0,0 +1,54 @@
+"""BatchWorld against the scalar game: exact mode state for state, default mode in distribution."""
+import pytest
+
+CHECK_INSTANCES = 64
+CHECK_TICKS = 2000
+
+
+def random_actions(game, ticks, n, seed):
+    return game.np.random.default_rng(seed).integers(0, len(game.ENV_ACTIONS), (ticks, n))
+
+
+def stepped(game, actions, seed, exact, start_map=None):
+    batch = game.BatchWorld(actions.shape[1], seed, start_map or game.BATCH_START, exact=exact)
+    for row in actions:
+        batch.step(row)
+    return batch
+
+
+@pytest.mark.parametrize("start_map", [None, "Pallet Town", "Viridian Forest"])
+def test_exact_mode_matches_game_env(numpy_game, start_map):
+    game = numpy_game
+    start_map = start_map or game.BATCH_START
+    seed = 0
+    actions = random_actions(game, CHECK_TICKS, CHECK_INSTANCES, seed)
+    batch = stepped(game, actions, seed, exact=True, start_map=start_map)
+    env = game.GameEnv(start_map)
+    mismatches = []
+    for i in range(CHECK_INSTANCES):
+        env.reset(seed + i)
+        for action in actions[:, i].tolist():
+            env.step(action)
+        if env.game.fingerprint() != batch.fingerprint(i):
+            mismatches.append(i)
+    assert mismatches == []
+
+
+def test_default_mode_is_deterministic(numpy_game):
+    game = numpy_game
+    actions = random_actions(game, 500, CHECK_INSTANCES, 4)
+    first, second = (stepped(game, actions, 4, exact=False) for _ in range(2))
+    assert [first.fingerprint(i) for i in range(CHECK_INSTANCES)] == \
+        [second.fingerprint(i) for i in range(CHECK_INSTANCES)]
+
+
+def test_default_mode_encounter_rate(numpy_game):
+    # Per-map NumPy generators draw different numbers than the scalar game's
+    # streams, so battle counts can only agree in distribution: within five
+    # standard deviations of the exact run's
+    game = numpy_game
+    actions = random_actions(game, CHECK_TICKS, CHECK_INSTANCES * 16, 0)
+    fast = int(stepped(game, actions, 0, exact=False).battles.sum())
+    exact = int(stepped(game, actions, 0, exact=True).battles.sum())
+    assert exact > 0
+    assert abs(fast - exact) <= 5 * (fast + exact + 1) ** 0.5
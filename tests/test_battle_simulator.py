@@ -0,0 +1,48 @@
+"""simulate_battles (NumPy Monte Carlo) against battles fought through the real Battle class."""
+import pytest
+
+
+def play_battle(game, player_stats, wild_stats, species="Rattata", max_turns=1000):
+    """Fight one battle through the real Battle class, holding A; returns the Battle."""
+    battle = game.Battle(None, species, player_stats, wild_stats)
+    keys = game.KeyState((game.pygame.K_a,))
+    while not battle.battle_over and battle.turns < max_turns:
+        if battle.turn == "player":
+            battle.handle_input(keys)
+        else:
+            battle.update()
+    return battle
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_simulator_matches_battle(numpy_game, seed):
+    game = numpy_game
+    n = 1000
+    p_hp, p_atk, w_hp, w_atk = game.sample_battle_stats(n, seed)
+    batch = game.simulate_battles(p_hp, p_atk, w_hp, w_atk)
+    for i in range(n):
+        battle = play_battle(game, {"hp": int(p_hp[i]), "attack": int(p_atk[i])},
+                             {"hp": int(w_hp[i]), "attack": int(w_atk[i])})
+        remaining = battle.player_pokemon["hp"] if battle.player_won else battle.wild_pokemon["hp"]
+        assert (battle.player_won, battle.turns, remaining) == \
+            (bool(batch["won"][i]), int(batch["turns"][i]), int(batch["remaining_hp"][i])), i
+
+
+def test_summary_counts(numpy_game):
+    game = numpy_game
+    result = game.simulate_battles(*game.sample_battle_stats(5000, 3))
+    assert result["n"] == 5000
+    assert result["wins"] + result["losses"] + result["undecided"] == 5000
+    assert result["wins"] == int(result["won"].sum())
+    assert result["win_rate"] == pytest.approx(result["wins"] / 5000)
+    assert int(result["turns_hist"].sum()) == 5000 - result["undecided"]
+
+
+def test_stalemate_is_undecided(numpy_game):
+    # Attack 2 deals no damage (attack - 2), so nobody ever faints
+    game = numpy_game
+    np = game.np
+    result = game.simulate_battles(np.array([20]), np.array([2]), np.array([15]), np.array([2]), max_turns=50)
+    assert result["undecided"] == 1
+    battle = play_battle(game, {"hp": 20, "attack": 2}, {"hp": 15, "attack": 2}, max_turns=50)
+    assert not battle.battle_over
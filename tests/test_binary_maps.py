@@ -0,0 +1,110 @@
+"""The .acmp map codec: converted maps must answer every query like their source."""
+import os
+
+import pytest
+
+from conftest import MAP_NAMES
+
+
+def probe_area(game, game_map, area):
+    """check_collision, is_grass and get_door for a player rect at every 8px step over area."""
+    tile = game.TILE_SIZE
+    rects = [game.pygame.Rect(x, y, tile, tile)
+             for y in range(area.top, area.bottom, tile // 2)
+             for x in range(area.left, area.right, tile // 2)]
+    return [(game_map.check_collision(r), game_map.is_grass(r), game_map.get_door(r)) for r in rects]
+
+
+def assert_same_after_edits(game, source, loaded):
+    """Compare both maps over the whole area, then around every wall and grass
+    rect after removing it and after putting it back, and around a wall added
+    to a free tile and removed again."""
+    Rect = game.pygame.Rect
+    whole = Rect(-8, -8, source.width + 16, source.height + 16)
+    assert probe_area(game, source, whole) == probe_area(game, loaded, whole)
+    edits = [("remove_wall", "add_wall", rect) for rect in list(source.walls)]
+    edits += [("remove_grass", "add_grass", rect) for rect in list(source.grass)]
+    free = next((i for i, solid in enumerate(source.solid) if not solid), None)
+    if free is not None:
+        row, col = divmod(free, source.cols)
+        tile = game.TILE_SIZE
+        edits.append(("add_wall", "remove_wall", Rect(col * tile, row * tile, tile, tile)))
+    for first, second, rect in edits:
+        area = rect.inflate(2 * game.TILE_SIZE, 2 * game.TILE_SIZE)
+        for method in (first, second):
+            getattr(source, method)(Rect(rect))
+            getattr(loaded, method)(Rect(rect))
+            assert probe_area(game, source, area) == probe_area(game, loaded, area), (method, rect)
+
+
+@pytest.fixture(scope="module")
+def converted(game, tmp_path_factory):
+    out_dir = tmp_path_factory.mktemp("acmp")
+    game.convert_maps(game.maps, str(out_dir))
+    return game.MapRegistry(str(out_dir))
+
+
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_converted_map_matches_source(game, converted, name):
+    source, loaded = game.maps.build(name), converted.build(name)
+    assert (loaded.width, loaded.height) == (source.width, source.height)
+    assert loaded.exits == source.exits
+    assert loaded.doors == source.doors
+    assert loaded.encounters.species == source.encounters.species
+    assert_same_after_edits(game, source, loaded)
+
+
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_encoding_is_stable(game, converted, name):
+    # Re-encoding a loaded map gives back the bytes it was read from
+    with open(os.path.join(converted.directory, converted.index[name]), "rb") as f:
+        data = f.read()
+    assert game.encode_binary_map(converted.build(name)) == data
+
+
+def layered_map(game):
+    """A map with tile layers and loose rects of both kinds (walls overlapping the layer too)."""
+    Rect = game.pygame.Rect
+    cols, rows = 40, 30
+    solid, grass = bytearray(cols * rows), bytearray(cols * rows)
+    for i in range(0, cols * rows, 7):
+        solid[i] = 1
+    for i in range(3, cols * rows, 11):
+        grass[i] = not solid[i]
+    walls = [Rect(5, 3, 40, 37), Rect(160, 160, 32, 16), Rect(16 * 7, 0, 16, 16)]
+    return game.Map("Layered", cols * 16, rows * 16, walls, [Rect(300, 200, 24, 24)], ["Pidgey"],
+                    {"left": ("Route 1", 600, 200)}, [(Rect(64, 64, 16, 16), "Pallet Town", 300, 200)],
+                    solid_tiles=solid, grass_tiles=grass)
+
+
+def test_layered_map_round_trip(game, tmp_path):
+    source = layered_map(game)
+    path = str(tmp_path / "layered.acmp")
+    game.write_binary_map(source, path)
+    loaded = game.BinaryMap(path).build()
+    assert isinstance(loaded.base_solid, memoryview)   # the layer stays a view of the file
+    assert_same_after_edits(game, source, loaded)
+    # Removing a wall tile that lives in the layer copies the layer, never the file
+    tile = game.TILE_SIZE
+    for index, solid in enumerate(loaded.base_solid):
+        row, col = divmod(index, loaded.cols)
+        rect = game.pygame.Rect(col * tile, row * tile, tile, tile)
+        if solid and rect.collidelist(source.walls) < 0:
+            break
+    source.remove_wall(rect)
+    loaded.remove_wall(rect)
+    assert not loaded.check_collision(rect)
+    assert game.BinaryMap(path).layer(game.LAYER_WALLS)[index] == 1
+    whole = game.pygame.Rect(-8, -8, source.width + 16, source.height + 16)
+    assert probe_area(game, source, whole) == probe_area(game, loaded, whole)
+
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda data: b"XXXX" + data[4:], "not an ACMP"),
+    (lambda data: data[:-1], "truncated"),
+])
+def test_bad_files_are_rejected(game, tmp_path, corrupt, message):
+    path = tmp_path / "bad.acmp"
+    path.write_bytes(corrupt(game.encode_binary_map(layered_map(game))))
+    with pytest.raises(ValueError, match=message):
+        game.BinaryMap(str(path))
@@ -0,0 +1,86 @@
+"""EncounterTable's alias-method table against the weights it was built from."""
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import MAP_NAMES
+
+
+def table_odds(table):
+    """Exact probability of each species under the alias table: column i is
+    picked with 1/n and keeps its own species with prob[i], else alias[i]'s."""
+    odds = Counter()
+    for i in range(table.size):
+        odds[table.species[i]] += table.prob[i] / table.size
+        odds[table.species[table.alias[i]]] += (1.0 - table.prob[i]) / table.size
+    return odds
+
+
+def weight_odds(entries):
+    weights = Counter()
+    for entry in entries:
+        name, weight = (entry, 1.0) if isinstance(entry, str) else entry[:2]
+        weights[name] += weight
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def assert_table_matches(table, entries):
+    odds = table_odds(table)
+    expected = weight_odds(entries)
+    assert odds.keys() == expected.keys()
+    for name, p in expected.items():
+        assert odds[name] == pytest.approx(p, abs=1e-12)
+
+
+@pytest.mark.parametrize("entries", [
+    ["Pidgey"],
+    ["Pidgey", "Rattata"],
+    [("Pidgey", 1), ("Rattata", 0)],
+    [("Pidgey", 5), ("Rattata", 3), ("Spearow", 1), ("Ekans", 0.25, (3, 5))],
+    ["Zubat"] * 7 + [("Geodude", 3), ("Paras", 0.5)],
+])
+def test_alias_table_reproduces_weights(game, entries):
+    assert_table_matches(game.EncounterTable(entries), entries)
+
+
+def test_random_weights(game):
+    rng = random.Random(5)
+    for _ in range(200):
+        entries = [(f"Mon{i}", rng.choice((0, rng.random(), rng.randint(1, 50))))
+                   for i in range(rng.randint(1, 30))]
+        if sum(weight for _, weight in entries) > 0:
+            assert_table_matches(game.EncounterTable(entries), entries)
+
+
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_map_tables(game, name):
+    game_map = game.maps.build(name)
+    if game_map.wild_pokemon:
+        assert_table_matches(game_map.encounters, game_map.wild_pokemon)
+
+
+def test_sampling_follows_the_table(game):
+    entries = [("Pidgey", 6), ("Rattata", 3), ("Spearow", 1)]
+    table = game.EncounterTable(entries)
+    rng = random.Random(1)
+    n = 100000
+    counts = Counter(table.sample(rng) for _ in range(n))
+    for name, p in weight_odds(entries).items():
+        # within five standard deviations of the binomial count
+        assert abs(counts[name] - n * p) <= 5 * (n * p * (1 - p)) ** 0.5
+
+
+def test_sample_costs_one_draw(game):
+    table = game.EncounterTable(["Pidgey", ("Rattata", 2)])
+    a, b = random.Random(9), random.Random(9)
+    for _ in range(100):
+        table.sample(a)
+        b.random()
+    assert a.random() == b.random()
+
+
+def test_empty_table(game):
+    table = game.EncounterTable([])
+    assert len(table) == 0
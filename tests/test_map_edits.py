@@ -0,0 +1,30 @@
+"""Runtime map edits keep their own rects: moving the caller's rect changes nothing."""
+import pytest
+
+
+@pytest.mark.parametrize("add, query", [
+    (lambda m, r: m.add_wall(r), lambda m, r: m.check_collision(r)),
+    (lambda m, r: m.add_grass(r), lambda m, r: m.is_grass(r)),
+    (lambda m, r: m.add_door(r, "Pallet Town", 300, 200), lambda m, r: m.get_door(r) is not None),
+])
+def test_caller_rect_is_copied(game, add, query):
+    Rect = game.pygame.Rect
+    game_map = game.maps.build("Route 1")
+    spot, elsewhere = Rect(48, 48, 16, 16), Rect(400, 300, 16, 16)
+    before = query(game_map, elsewhere)
+    rect = Rect(spot)
+    add(game_map, rect)
+    rect.topleft = elsewhere.topleft          # the caller reuses its rect
+    assert query(game_map, spot)
+    assert query(game_map, elsewhere) == before
+
+
+def test_copied_rects_can_be_removed(game):
+    game_map = game.maps.build("Pallet Town")
+    rect = game.pygame.Rect(32, 32, 16, 16)
+    game_map.add_wall(rect)
+    game_map.add_door(rect, "Route 1", 300, 380)
+    game_map.remove_door(rect)
+    game_map.remove_wall(rect)
+    assert all(door[0] != rect for door in game_map.doors)
+    assert rect not in game_map.walls
@@ -0,0 +1,133 @@
+"""NavGrid, A* and flow fields against a brute-force search over Map.check_collision."""
+import random
+from collections import deque
+
+import pytest
+
+from conftest import MAP_NAMES
+
+OFFSETS = [(0, 0), (4, 8), (12, 0)]
+
+
+def lattice(game, grid):
+    """Every position of grid's lattice."""
+    tile = game.TILE_SIZE
+    return [(grid.x0 + col * tile, grid.y0 + row * tile) for row in range(grid.rows) for col in range(grid.cols)]
+
+
+def brute_distances(game, game_map, grid, goals, avoid_grass=False):
+    """BFS over the lattice, asking the map itself whether each position is free."""
+    tile = game.TILE_SIZE
+    rect = game.pygame.Rect(0, 0, tile, tile)
+    free = {}
+    for pos in lattice(game, grid):
+        rect.topleft = pos
+        free[pos] = not game_map.check_collision(rect) and not (avoid_grass and game_map.is_grass(rect))
+    dist = {goal: 0 for goal in goals if free[goal]}
+    queue = deque(dist)
+    while queue:
+        x, y = queue.popleft()
+        for dx, dy, _ in game.STEPS:
+            n = (x + dx * tile, y + dy * tile)
+            if free.get(n) and n not in dist:
+                dist[n] = dist[(x, y)] + 1
+                queue.append(n)
+    return free, dist
+
+
+@pytest.mark.parametrize("offset", OFFSETS)
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_navgrid_matches_the_map(game, name, offset):
+    game_map = game.maps.build(name)
+    tile = game.TILE_SIZE
+    rect = game.pygame.Rect(0, 0, tile, tile)
+    for avoid_grass in (False, True):
+        grid = game.NavGrid(game_map, offset, avoid_grass)
+        for node, pos in enumerate(lattice(game, grid)):
+            rect.topleft = pos
+            grass = game_map.is_grass(rect)
+            assert grid.grass[node] == grass, pos
+            assert grid.walkable[node] == (not game_map.check_collision(rect) and not (avoid_grass and grass)), pos
+
+
+@pytest.mark.parametrize("name", MAP_NAMES[:3])
+def test_navgrid_without_numpy(game, monkeypatch, name):
+    game_map = game.maps.build(name)
+    tables = game.NavGrid(game_map, (4, 8))
+    monkeypatch.setattr(game, "np", None)
+    scalar = game.NavGrid(game_map, (4, 8))
+    assert (scalar.walkable, scalar.grass) == (tables.walkable, tables.grass)
+
+
+def assert_walk(game, game_map, path):
+    tile = game.TILE_SIZE
+    for (x0, y0), (x1, y1) in zip(path, path[1:]):
+        assert abs(x1 - x0) + abs(y1 - y0) == tile
+    for pos in path:
+        assert not game_map.check_collision(game.pygame.Rect(pos, (tile, tile)))
+
+
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_astar_finds_shortest_paths(game, name):
+    game_map = game.maps.build(name)
+    navigator = game.Navigator(game_map)
+    rng = random.Random(name)
+    for offset in OFFSETS:
+        grid = navigator.grid(offset)
+        positions = lattice(game, grid)
+        free = [pos for node, pos in enumerate(positions) if grid.walkable[node]]
+        if not free:
+            continue
+        for _ in range(5):
+            goal = rng.choice(free)
+            _, dist = brute_distances(game, game_map, grid, [goal])
+            for start in rng.sample(free, min(10, len(free))):
+                path = navigator.find_path(start, goal)
+                if start not in dist:
+                    assert path is None
+                    continue
+                assert path[0] == start and path[-1] == goal
+                assert len(path) - 1 == dist[start]
+                assert_walk(game, game_map, path)
+
+
+@pytest.mark.parametrize("name", MAP_NAMES)
+def test_flow_fields_match_bfs(game, name):
+    game_map = game.maps.build(name)
+    navigator = game.Navigator(game_map)
+    rng = random.Random(name)
+    start = (rng.randrange(0, 16), rng.randrange(0, 16))
+    grid = navigator.grid(start)
+    for door, (rect, *_target) in enumerate(game_map.doors):
+        field = navigator.field_to_door(start, door)
+        goals = [grid.pos(node) for node in grid.nodes_touching(rect)]
+        _, dist = brute_distances(game, game_map, grid, goals)
+        for pos in lattice(game, grid):
+            assert field.distance(pos) == dist.get(pos), pos
+            if dist.get(pos):
+                path = field.path(pos)
+                assert len(path) - 1 == dist[pos] and path[-1] in goals
+                assert_walk(game, game_map, path)
+                assert field.direction(pos) is not None
+
+
+def test_avoid_grass_paths(game):
+    game_map = game.maps.build("Route 1")
+    navigator = game.Navigator(game_map)
+    grid = navigator.grid((0, 0), avoid_grass=True)
+    free = [pos for node, pos in enumerate(lattice(game, grid)) if grid.walkable[node]]
+    goal = free[len(free) // 2]
+    field = navigator.field_to((0, 0), goal, avoid_grass=True)
+    _, dist = brute_distances(game, game_map, grid, [goal], avoid_grass=True)
+    for pos in free:
+        assert field.distance(pos) == dist.get(pos)
+
+
+def test_edits_rebuild_the_grid(game):
+    game_map = game.maps.build("Pallet Town")
+    navigator = game.Navigator(game_map)
+    grid = navigator.grid((0, 0))
+    node = next(n for n in range(len(grid.walkable)) if grid.walkable[n])
+    pos = grid.pos(node)
+    game_map.add_wall(game.pygame.Rect(pos, (game.TILE_SIZE, game.TILE_SIZE)))
+    assert not navigator.grid((0, 0)).walkable[node]
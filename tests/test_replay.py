@@ -0,0 +1,75 @@
+"""The .acrp replay codec: recordings decode to the same input and replay bit-exactly."""
+import random
+
+import pytest
+
+
+def recorded(game, seed=7, ticks=3000):
+    """An InputRecorder fed with RandomInput for ticks, plus the inputs it saw."""
+    recorder = game.InputRecorder(seed)
+    inputs = []
+    for keys, pressed in recorder.wrap(game.RandomInput(seed)):
+        inputs.append((frozenset(k for k in game.REPLAY_KEYS if keys[k]), frozenset(pressed)))
+        if len(inputs) == ticks:
+            break
+    return recorder, inputs
+
+
+def test_round_trip(game):
+    recorder, inputs = recorded(game)
+    replay = game.Replay.decode(recorder.encode(fingerprint=1234))
+    assert (replay.seed, replay.ticks, replay.fingerprint) == (7, 3000, 1234)
+    assert [tuple(run) for run in recorder.runs] == replay.runs
+    assert [(frozenset(k for k in game.REPLAY_KEYS if keys[k]), frozenset(pressed))
+            for keys, pressed in replay] == inputs
+
+
+def test_long_runs_use_varint_counts(game):
+    recorder = game.InputRecorder(0)
+    held = game.KeyState((game.pygame.K_UP,))
+    for count in (1, 127, 128, 300, 70000):
+        for _ in range(count):
+            recorder.record(held, ())
+        recorder.record(game.KeyState(), (game.pygame.K_SPACE,))
+    replay = game.Replay.decode(recorder.encode())
+    assert [run[0] for run in replay.runs] == [1, 1, 127, 1, 128, 1, 300, 1, 70000, 1]
+    assert len(replay) == recorder.ticks
+
+
+def test_headless_replay_is_bit_exact(game, tmp_path):
+    path = str(tmp_path / "session.acrp")
+    recorder = game.InputRecorder(11)
+    stats = game.run_headless(4000, game.RandomInput(11), 11, recorder)
+    recorder.save(path, stats["fingerprint"])
+    replay = game.Replay.from_file(path)
+    again = game.run_headless(replay.ticks, replay, replay.seed)
+    assert again["fingerprint"] == replay.fingerprint
+    assert (again["battles"], again["map_changes"]) == (stats["battles"], stats["map_changes"])
+
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda data: data[:10], "truncated"),
+    (lambda data: b"NOPE" + data[4:], "not a replay"),
+    (lambda data: data[:4] + b"\x09\x00" + data[6:], "unsupported replay version"),
+    (lambda data: data[:-1], "truncated"),
+    (lambda data: data + bytes((5, 0, 0)), "tick count"),
+])
+def test_bad_files_are_rejected(game, corrupt, message):
+    recorder, _ = recorded(game, ticks=50)
+    with pytest.raises(ValueError, match=message):
+        game.Replay.decode(corrupt(recorder.encode()))
+
+
+def test_random_masks_round_trip(game):
+    # Every held / pressed combination of the recorded keys survives encoding
+    rng = random.Random(3)
+    keys = game.REPLAY_KEYS
+    recorder = game.InputRecorder(rng.randrange(2 ** 63))
+    expected = []
+    for _ in range(2000):
+        held = frozenset(k for k in keys if rng.random() < 0.3)
+        pressed = frozenset(k for k in keys if rng.random() < 0.1)
+        recorder.record(game.KeyState(held), pressed)
+        expected.append((held, pressed))
+    replay = game.Replay.decode(recorder.encode())
+    assert [(frozenset(k for k in keys if state[k]), frozenset(pressed)) for state, pressed in replay] == expected